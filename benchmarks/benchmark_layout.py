@@ -0,0 +1,62 @@
+""" Benchmark of the DHN layout backends: runtime and normalized stress of the sparse stress engine against Kamada-Kawai.
+
+Run from the project source folder:
+
+    python benchmarks/benchmark_layout.py --sizes 100 500 1000 --sparse-only-sizes 10000 100000
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+
+import networkx as nx
+
+from src.graph_generator import GraphDHNGenerator
+from src.graph_generator_params import GraphGeneratorParameters
+from src.layout_engine import layout_stress, sparse_stress_layout
+
+
+def generate_region(nb_nodes, target_ratio, seed):
+    """ Generates one DHN-like region with the constructive generation mode
+
+    Args:
+        nb_nodes (int): Number of nodes of the region
+        target_ratio (float): Targeted ratio of #Edges/(#Nodes - 1)
+        seed (int): Seed of the generation
+
+    Returns:
+        Graph (networkx.Graph)
+    """
+    params = GraphGeneratorParameters(nb_nodes_per_region=nb_nodes, target_ratio=target_ratio, region_generation_mode='constructive', seed=seed)
+    return GraphDHNGenerator(params, verbose=0).generate_random_region_with_target()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='*', default=[100, 500, 1000], help='Graph sizes where both backends are run')
+    parser.add_argument('--sparse-only-sizes', type=int, nargs='*', default=[10000, 100000], help='Graph sizes where only the sparse backend is run')
+    parser.add_argument('--target-ratio', type=float, default=1.05)
+    parser.add_argument('--nb-pivots', type=int, default=50)
+    parser.add_argument('--stress-sources', type=int, default=300, help='Sampled sources used to estimate the stress above 2000 nodes')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'nodes':>8} {'backend':>14} {'time (s)':>10} {'stress':>8}")
+    for nb_nodes in args.sizes + args.sparse_only_sizes:
+        G = generate_region(nb_nodes, args.target_ratio, args.seed)
+        nb_sources = None if nb_nodes <= 2000 else args.stress_sources
+        backends = [('sparse_stress', lambda: sparse_stress_layout(G, weight='weight', nb_pivots=args.nb_pivots, seed=args.seed))]
+        if nb_nodes in args.sizes:
+            backends.insert(0, ('kamada_kawai', lambda: nx.kamada_kawai_layout(G, weight='weight')))
+        for name, layout in backends:
+            start = time.perf_counter()
+            pos = layout()
+            elapsed = time.perf_counter() - start
+            stress = layout_stress(G, pos, weight='weight', nb_sources=nb_sources, seed=args.seed)
+            print(f'{nb_nodes:>8} {name:>14} {elapsed:>10.2f} {stress:>8.4f}', flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,450 @@
+""" Ensemble generation of synthetic DHNs: the networks are generated on a process pool, each with its own seed, and written to disk as soon as they are finished.
+Batches are checkpointed in a manifest (root_folder/manifest.jsonl): running the same command again resumes an interrupted batch, skipping the completed networks and retrying the failed ones.
+
+Command line usage (from the project source folder):
+
+    python -m src.batch_generation --nb-networks 100 --nb-regions 2 5 --nb-nodes-per-region 20 40 --nb-producers-to-reach 1 4 --seed 0
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+
+import numpy as np
+
+from src.graph_generator import GraphDHNGenerator
+from src.graph_generator_params import GraphGeneratorParameters
+from src.dhn_topology import DHNTopology
+from src.storage import EXCEL_STORAGE, STORAGE_FORMATS
+
+DEFAULT_ROOT_FOLDER = 'Synthetic_DHNs'
+DEFAULT_NAME_FORMAT = 'synthetic_dhn_{}'
+MANIFEST_FILE = 'manifest.jsonl'
+
+STATUS_PENDING = 'pending'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+def _sample_value(rng: np.random.Generator, value):
+    """ Samples one parameter value
+
+    Args:
+        rng (numpy.random.Generator): Random generator of the parameters sampling
+        value: Fixed value, or (low, high) range. Integer ranges are sampled uniformly with both bounds included, float ranges uniformly in [low, high)
+
+    Returns:
+        the sampled value
+    """
+    if not isinstance(value, (tuple, list)):
+        return value
+    low, high = value
+    if isinstance(low, (int, np.integer)) and isinstance(high, (int, np.integer)):
+        return int(rng.integers(low, high, endpoint=True))
+    return float(rng.uniform(low, high))
+
+
+def hash_file(file: str, chunk_size: int = 1 << 20):
+    """ Computes the sha256 hash of a file
+
+    Args:
+        file (str): Path of the file
+        chunk_size (int): Size of the read chunks in bytes (default = 1 MiB)
+
+    Returns:
+        str: hexadecimal digest
+    """
+    digest = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_artefacts(folder: str):
+    """ Computes the sha256 hash of every file of a generated network folder
+
+    Args:
+        folder (str): Folder of the network
+
+    Returns:
+        dict: hash of each file, indexed by its name relative to the folder
+    """
+    artefacts = {}
+    for directory, _, files in os.walk(folder):
+        for file in sorted(files):
+            path = os.path.join(directory, file)
+            artefacts[os.path.relpath(path, folder).replace(os.sep, '/')] = hash_file(path)
+    return artefacts
+
+
+def build_network_tasks(nb_networks: int = 1,
+                        param_grid: dict = None,
+                        param_ranges: dict = None,
+                        fixed_params: dict = None,
+                        seed: int = None,
+                        start_index: int = 1,
+                        name_format: str = DEFAULT_NAME_FORMAT):
+    """ Builds the description (name, seed and control parameters) of each network of a batch.
+    Every combination of the parameter grid is generated nb_networks times, the parameters given as ranges being sampled again for each network.
+
+    Args:
+        nb_networks (int): Number of networks per combination of the parameter grid (default = 1)
+        param_grid (dict, optional): Lists of values of GraphGeneratorParameters keyword arguments, ex: {'nb_regions': [2, 4]} (default = None)
+        param_ranges (dict, optional): (low, high) ranges of GraphGeneratorParameters keyword arguments, ex: {'nb_nodes_per_region': (20, 40)} (default = None)
+        fixed_params (dict, optional): Fixed GraphGeneratorParameters keyword arguments (default = None)
+        seed (int, optional): Seed of the batch, from which the parameters and the seed of each network are drawn (default = None)
+        start_index (int): Index of the first network, used in its name (default = 1)
+        name_format (str): Format of the networks folder names (default = 'synthetic_dhn_{}')
+
+    Returns:
+        List[dict]: one dict per network with keys 'index', 'name', 'seed' and 'params'
+    """
+    param_grid = param_grid or {}
+    param_ranges = param_ranges or {}
+    fixed_params = fixed_params or {}
+    grid_names = list(param_grid.keys())
+    combinations = list(product(*[param_grid[name] for name in grid_names]))
+    nb_total = nb_networks * len(combinations)
+
+    params_sequence, seeds_sequence = np.random.SeedSequence(seed).spawn(2)
+    rng = np.random.default_rng(params_sequence)
+    seeds = seeds_sequence.generate_state(nb_total, dtype=np.uint64)
+
+    tasks = []
+    for combination in combinations:
+        for _ in range(nb_networks):
+            index = start_index + len(tasks)
+            params = {'n_workers': 1} # The pool is over networks, not regions
+            params.update(fixed_params)
+            params.update(dict(zip(grid_names, combination)))
+            for name, value in param_ranges.items():
+                params[name] = _sample_value(rng, value)
+            tasks.append({'index': index,
+                          'name': name_format.format(index),
+                          'seed': int(seeds[len(tasks)]),
+                          'params': params})
+    return tasks
+
+
+def generate_network(task: dict, root_folder: str = DEFAULT_ROOT_FOLDER, heating_demand_model: int = 2, verbose: int = 0, storage_format: str = EXCEL_STORAGE):
+    """ Generates one connected DHN, its pipes and its heating demands, and writes them in root_folder/name
+
+    Args:
+        task (dict): Network description, as returned by *build_network_tasks*
+        root_folder (str): Folder containing the generated networks (default = 'Synthetic_DHNs')
+        heating_demand_model (int): Heating demand model of the substations, 1 for heating law and 2 for DPE (default = 2)
+        verbose (int): If 0, the outputs of the generation are discarded (default = 0)
+        storage_format (str): Storage of the network tables, 'excel', 'parquet', 'feather' or 'hdf5' (default = 'excel')
+
+    Returns:
+        dict: summary of the generation with keys 'index', 'name', 'seed', 'params', 'status' ('done' or 'failed'), 'folder', 'nb_nodes', 'nb_edges', 'producers', 'artefacts' (sha256 of the written files), 'elapsed' and 'error'
+    """
+    result = dict(task)
+    result.update({'status': STATUS_FAILED, 'folder': os.path.join(root_folder, task['name']), 'nb_nodes': 0, 'nb_edges': 0, 'producers': [], 'artefacts': {}, 'error': None})
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.ExitStack() as stack:
+        if verbose == 0:
+            stack.enter_context(contextlib.redirect_stdout(devnull))
+        try:
+            params = GraphGeneratorParameters(seed=task['seed'], **task['params'])
+            generator = GraphDHNGenerator(params, verbose=verbose)
+            generator.generate_random_connected_dhn(plot_graph=False)
+            DHNTopology(generator, graph_folder_name=task['name'], heating_demand_model=heating_demand_model, root_folder=root_folder, storage_format=storage_format)
+            result.update({'status': STATUS_DONE,
+                           'nb_nodes': generator.graph.number_of_nodes(),
+                           'nb_edges': generator.graph.number_of_edges(),
+                           'producers': [int(p) for p in generator.producer_indices],
+                           'artefacts': hash_artefacts(result['folder'])})
+        except Exception as ex:
+            result['error'] = repr(ex)
+    result['elapsed'] = time.perf_counter() - start
+    return result
+
+
+def generate_batch(tasks, root_folder: str = DEFAULT_ROOT_FOLDER, heating_demand_model: int = 2, n_workers: int = None, verbose: int = 0, storage_format: str = EXCEL_STORAGE):
+    """ Generates the networks of a batch on a process pool. Each network is written to disk by its worker as soon as it is finished, and its summary is yielded in completion order.
+
+    Args:
+        tasks (List[dict]): Networks descriptions, as returned by *build_network_tasks*
+        root_folder (str): Folder containing the generated networks (default = 'Synthetic_DHNs')
+        heating_demand_model (int): Heating demand model of the substations, 1 for heating law and 2 for DPE (default = 2)
+        n_workers (int, optional): Number of processes. If None, the number of cores (default = None)
+        verbose (int): If 0, the outputs of the generations are discarded (default = 0)
+        storage_format (str): Storage of the networks tables, 'excel', 'parquet', 'feather' or 'hdf5' (default = 'excel')
+
+    Yields:
+        dict: summary of each generated network (see *generate_network*)
+    """
+    tasks = list(tasks)
+    if len(tasks) == 0:
+        return
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    n_workers = max(1, min(n_workers, len(tasks)))
+    os.makedirs(root_folder, exist_ok=True)
+
+    if n_workers == 1:
+        for task in tasks:
+            yield generate_network(task, root_folder, heating_demand_model, verbose, storage_format)
+        return
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(generate_network, task, root_folder, heating_demand_model, verbose, storage_format) for task in tasks]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+class BatchManifest(object):
+    """ Append-only manifest of a batch run, stored as JSON lines in the batch root folder.
+    The first line holds the batch configuration, then every line is the full record of one network (seed, parameters, status, artefacts hashes, ...). The last record of a network gives its current state, so updating a network costs one appended line and loading a 10,000 networks manifest takes a fraction of a second.
+
+    Attributes:
+        path (str): Path of the manifest file
+        config (dict): Configuration of the batch (root folder, heating demand model, ...)
+        entries (dict): Current record of each network, indexed by its name
+    """
+
+    def __init__(self, path: str):
+        """ Initializes the BatchManifest and loads the manifest file if it exists
+
+        Args:
+            path (str): Path of the manifest file
+        """
+        self.path = path
+        self.config = {}
+        self.entries = {}
+        if os.path.isfile(path):
+            self._load()
+
+    def exists(self):
+        """ Checks if the manifest has been created
+
+        Returns:
+            bool: True if the manifest file contains the batch configuration
+        """
+        return len(self.config) != 0
+
+    def _load(self):
+        """ Reads the manifest file, a truncated last line (interrupted write) is ignored
+        """
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if 'config' in record:
+                    self.config = record['config']
+                else:
+                    self.entries[record['name']] = record
+
+    def _append(self, records):
+        """ Appends records to the manifest file
+
+        Args:
+            records (List[dict]): Records to append
+        """
+        with open(self.path, 'a') as f:
+            f.write(''.join(json.dumps(record) + '\n' for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def create(self, tasks, config: dict):
+        """ Creates the manifest with every network pending
+
+        Args:
+            tasks (List[dict]): Networks descriptions, as returned by *build_network_tasks*
+            config (dict): Configuration of the batch
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'w') as f:
+            f.write(json.dumps({'config': config}) + '\n')
+        self.config = config
+        self.entries = {}
+        self.add(tasks)
+
+    def add(self, tasks):
+        """ Adds pending networks to the manifest, the networks already present are ignored
+
+        Args:
+            tasks (List[dict]): Networks descriptions, as returned by *build_network_tasks*
+        """
+        records = []
+        for task in tasks:
+            if task['name'] not in self.entries:
+                record = dict(task)
+                record.update({'status': STATUS_PENDING, 'attempts': 0, 'artefacts': {}, 'error': None})
+                self.entries[record['name']] = record
+                records.append(record)
+        self._append(records)
+
+    def record(self, result: dict):
+        """ Records the result of one generation attempt
+
+        Args:
+            result (dict): Summary of the generation (see *generate_network*)
+        """
+        record = dict(self.entries.get(result['name'], {}))
+        record.update(result)
+        record['attempts'] = record.get('attempts', 0) + 1
+        self.entries[record['name']] = record
+        self._append([record])
+
+    def is_complete(self, name: str, verify: bool = False):
+        """ Checks if a network has been generated
+
+        Args:
+            name (str): Name of the network
+            verify (bool): Whether to check the hashes of the written files, otherwise only their presence is checked (default = False)
+
+        Returns:
+            bool: True if the network is done and its files are unchanged
+        """
+        entry = self.entries[name]
+        if entry['status'] != STATUS_DONE or len(entry['artefacts']) == 0:
+            return False
+        for file, digest in entry['artefacts'].items():
+            path = os.path.join(entry['folder'], file)
+            if not os.path.isfile(path):
+                return False
+            if verify and hash_file(path) != digest:
+                return False
+        return True
+
+    def remaining_tasks(self, max_attempts: int = 3, verify: bool = False):
+        """ Gets the networks to (re)generate: never attempted, interrupted, failed or whose files are missing or modified.
+        A failed network is generated again with a new seed derived from its original seed and its attempts number, since the same seed would fail again.
+
+        Args:
+            max_attempts (int): Maximal number of failed attempts of a network (default = 3)
+            verify (bool): Whether to check the hashes of the files of completed networks (default = False)
+
+        Returns:
+            List[dict]: networks descriptions, in the manifest order
+        """
+        tasks = []
+        for name, entry in self.entries.items():
+            if self.is_complete(name, verify):
+                continue
+            if entry['status'] == STATUS_FAILED and entry['attempts'] >= max_attempts:
+                continue
+            seed = entry['seed']
+            if entry['status'] == STATUS_FAILED:
+                seed = int(np.random.SeedSequence([entry.get('base_seed', seed), entry['attempts']]).generate_state(1, dtype=np.uint64)[0])
+            tasks.append({'index': entry['index'],
+                          'name': name,
+                          'seed': seed,
+                          'base_seed': entry.get('base_seed', entry['seed']),
+                          'params': entry['params']})
+        return tasks
+
+    def summary(self):
+        """ Counts the networks per status
+
+        Returns:
+            dict: number of networks of each status
+        """
+        counts = {}
+        for entry in self.entries.values():
+            counts[entry['status']] = counts.get(entry['status'], 0) + 1
+        return counts
+
+
+def run_batch(tasks=None,
+              root_folder: str = DEFAULT_ROOT_FOLDER,
+              heating_demand_model: int = 2,
+              n_workers: int = None,
+              max_attempts: int = 3,
+              verify: bool = False,
+              verbose: int = 0,
+              storage_format: str = EXCEL_STORAGE):
+    """ Runs a checkpointed batch: every result is recorded in the manifest of root_folder as soon as it is finished.
+    If the manifest already exists the batch is resumed: completed networks are skipped, interrupted ones are generated again with their seed and failed ones with a new seed, up to max_attempts failures. New tasks are added to the manifest.
+
+    Args:
+        tasks (List[dict], optional): Networks descriptions, as returned by *build_network_tasks*. Not needed to resume a batch (default = None)
+        root_folder (str): Folder containing the generated networks and the manifest (default = 'Synthetic_DHNs')
+        heating_demand_model (int): Heating demand model of the substations, 1 for heating law and 2 for DPE. The model of an existing manifest prevails (default = 2)
+        n_workers (int, optional): Number of processes. If None, the number of cores (default = None)
+        max_attempts (int): Maximal number of failed attempts of a network (default = 3)
+        verify (bool): Whether to check the hashes of the files of completed networks on resume (default = False)
+        verbose (int): If 0, the outputs of the generations are discarded (default = 0)
+        storage_format (str): Storage of the networks tables, 'excel', 'parquet', 'feather' or 'hdf5'. The format of an existing manifest prevails (default = 'excel')
+
+    Yields:
+        dict: summary of each generated network (see *generate_network*)
+    """
+    manifest = BatchManifest(os.path.join(root_folder, MANIFEST_FILE))
+    if not manifest.exists():
+        manifest.create(tasks or [], {'root_folder': root_folder, 'heating_demand_model': heating_demand_model, 'storage_format': storage_format})
+    elif tasks:
+        manifest.add(tasks)
+    heating_demand_model = manifest.config.get('heating_demand_model', heating_demand_model)
+    storage_format = manifest.config.get('storage_format', storage_format)
+
+    for result in generate_batch(manifest.remaining_tasks(max_attempts, verify), root_folder, heating_demand_model, n_workers, verbose, storage_format):
+        manifest.record(result)
+        yield result
+
+
+def _parse_range(values):
+    """ Converts a command line value into a fixed value (one element) or a (low, high) range (two elements)
+    """
+    if values is None:
+        return None
+    if len(values) == 1:
+        return values[0]
+    if len(values) == 2:
+        return (values[0], values[1])
+    raise argparse.ArgumentTypeError('Expected one value or a (low, high) range')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generates a batch of synthetic DHNs on a process pool.')
+    parser.add_argument('--nb-networks', type=int, default=1, help='Number of networks to generate')
+    parser.add_argument('--root-folder', default=DEFAULT_ROOT_FOLDER, help='Folder of the generated networks')
+    parser.add_argument('--name-format', default=DEFAULT_NAME_FORMAT, help='Format of the networks folder names')
+    parser.add_argument('--start-index', type=int, default=1, help='Index of the first network')
+    parser.add_argument('--seed', type=int, default=None, help='Seed of the batch')
+    parser.add_argument('--n-workers', type=int, default=None, help='Number of processes (default: number of cores)')
+    parser.add_argument('--heating-demand-model', type=int, default=2, choices=[1, 2], help='1 for heating law, 2 for DPE')
+    parser.add_argument('--storage-format', default=EXCEL_STORAGE, choices=STORAGE_FORMATS, help='Storage of the networks tables')
+    parser.add_argument('--max-attempts', type=int, default=3, help='Maximal number of failed attempts of a network')
+    parser.add_argument('--verify', action='store_true', help='Check the hashes of the completed networks files on resume')
+    # GraphGeneratorParameters, given as one fixed value or a (low, high) range sampled for each network
+    parser.add_argument('--nb-regions', type=int, nargs='+', default=[2, 5])
+    parser.add_argument('--nb-nodes-per-region', type=int, nargs='+', default=[20, 40])
+    parser.add_argument('--nb-producers-to-reach', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--target-ratio', type=float, nargs='+', default=[1.01])
+    parser.add_argument('--E-rp', type=float, nargs='+', default=[0.5])
+    parser.add_argument('--E-ee', type=float, nargs='+', default=[0.1])
+    parser.add_argument('--edge-weight-mean', type=float, nargs='+', default=[1.0])
+    parser.add_argument('--edge-weight-std', type=float, nargs='+', default=[0.1])
+    parser.add_argument('--region-generation-mode', default='rejection', choices=['rejection', 'constructive'])
+    parser.add_argument('--layout-backend', default='kamada_kawai', choices=['kamada_kawai', 'sparse_stress', 'hierarchical'])
+    args = parser.parse_args(argv)
+
+    param_ranges = {name: _parse_range(getattr(args, name)) for name in ['nb_regions', 'nb_nodes_per_region', 'nb_producers_to_reach', 'target_ratio', 'E_rp', 'E_ee', 'edge_weight_mean', 'edge_weight_std']}
+    fixed_params = {'region_generation_mode': args.region_generation_mode, 'layout_backend': args.layout_backend}
+    tasks = build_network_tasks(args.nb_networks, param_ranges=param_ranges, fixed_params=fixed_params, seed=args.seed, start_index=args.start_index, name_format=args.name_format)
+
+    start = time.perf_counter()
+    nb_done = 0
+    nb_results = 0
+    for result in run_batch(tasks, args.root_folder, args.heating_demand_model, args.n_workers, args.max_attempts, args.verify, storage_format=args.storage_format):
+        nb_results += 1
+        nb_done += result['status'] == STATUS_DONE
+        if result['status'] == STATUS_DONE:
+            print(f"{result['name']}: {result['nb_nodes']} nodes, {result['nb_edges']} edges, producers {result['producers']} ({result['elapsed']:.1f} s)", flush=True)
+        else:
+            print(f"{result['name']}: failed ({result['error']})", flush=True)
+    summary = BatchManifest(os.path.join(args.root_folder, MANIFEST_FILE)).summary()
+    print(f'{nb_done}/{nb_results} networks generated in {time.perf_counter() - start:.1f} s, manifest: {summary}')
+
+if __name__ == '__main__':
+    main()
@@ -23,12 +23,14 @@ NORMALIZATION_DELTA_TEMPERATURE_KEY = "DeltaT"
 NORMALIZATION_HEAT_LOSS_PER_TEMP_KEY = "Loss_per_t"
 NORMALIZATION_DELAY_TIME_KEY = "Delay_time"
 
+NOMINAL_MASS_RATE = 20 # kg/s, mass rate of the base delay time
+
 BASE_VALUES = {
     POWER_DEMAND_LOSS_KEY: 20e6, # in W
     UPPER_TEMPERATURE_KEY: 373.15, # in K (100°C)
     LOWER_TEMPERATURE_KEY: 298.15, # in K (40°C)
     LOSS_PER_TEMPERATURE_KEY: 1 * (0.06) * 1e3, # d * length * h
-    DELAY_TIME_KEY: np.pi * (0.1*0.1) * RHO * 10e3 / 20, # in hours 
+    DELAY_TIME_KEY: np.pi * (0.1*0.1) * RHO * 10e3 / NOMINAL_MASS_RATE, # in s (pi.d2.RHO.length / mass rate with d = 0.1 m and length = 10 km)
 }
 
 DEMAND_NOMINAL = 1e6
@@ -70,11 +70,101 @@ distribution_classes_dpe = {
 min_heating_area = 500
 max_heating_area = 5000
 
-def generate_uniform_value_in_dpe(dpe_class):
+# Base heating profiles of the building types
+BUILDING_TYPES = ['COM', 'MFH', 'SFH', 'APPRT']
+HEATING_PROFILES_FILE = os.path.join('src', 'files', 'heating_demands_profiles.csv')
+HEATING_PROFILES_V2_FILE = os.path.join('src', 'files', 'heating_demands_profiles_v2.csv')
+
+class HeatingProfiles(object):
+    """Base heating profiles of the building types over the year, loaded once per process (see *load_heating_profiles*)
+
+    Attributes:
+        building_types (List[str]): the building types, in the rows order of values
+        values (numpy.ndarray): read-only profiles, one contiguous row of hourly values per building type
+        integrals (dict): integral of the profile of each building type over the year
+        base_with_offset (numpy.ndarray): read-only profiles followed by a row of ones, base of the *FactorizedLoads*
+    """
+    
+    def __init__(self, building_types, values):
+        """Initializes the HeatingProfiles
+
+        Args:
+            building_types (List[str]): the building types, in the rows order of values
+            values (numpy.ndarray): the profiles, one row per building type
+        """
+        self.building_types = list(building_types)
+        self.values = values
+        self._rows = {key: i for i, key in enumerate(self.building_types)}
+        # Same summation order as the sum over the CSV column, so that profile factors are unchanged
+        self.integrals = {key: float(sum(values[i].tolist())) for key, i in self._rows.items()}
+        # Base of the factorized loads: the profiles and a constant row for the offsets
+        self.base_with_offset = np.vstack([values, np.ones((1, values.shape[1]))])
+        self.base_with_offset.setflags(write=False)
+        
+    def __getitem__(self, key):
+        return self.values[self._rows[key]]
+
+_heating_profiles_cache = {} # Loaded profiles, indexed by (CSV file, memory-mapped)
+
+def _write_heating_profiles_sidecar(csv_file, npy_file):
+    """Converts the CSV base heating profiles into a .npy sidecar file (one row per building type). The file is written under a temporary name then renamed, so that concurrent workers never read a partial file
+
+    Args:
+        csv_file (str): the CSV profiles file
+        npy_file (str): the sidecar file
+
+    Returns:
+        None
+    """
+    df_profiles = pd.read_csv(csv_file)
+    values = np.ascontiguousarray(df_profiles[BUILDING_TYPES].to_numpy(dtype=float).T)
+    tmp_file = f'{npy_file}.{os.getpid()}.tmp'
+    with open(tmp_file, 'wb') as f:
+        np.save(f, values)
+    os.replace(tmp_file, npy_file)
+
+def load_heating_profiles(csv_file=HEATING_PROFILES_FILE, mmap=True) -> HeatingProfiles:
+    """Loads the base heating profiles once per process. The CSV file is parsed once into a .npy sidecar file next to it (rebuilt when the CSV is newer), which is memory-mapped read-only so that the worker processes of a batch share the same physical pages
+
+    Args:
+        csv_file (str, optional): the CSV profiles file. Defaults to HEATING_PROFILES_FILE.
+        mmap (bool, optional): whether to memory-map the sidecar file, otherwise it is read in memory. Defaults to True.
+
+    Returns:
+        HeatingProfiles: the base heating profiles
+    """
+    key = (os.path.abspath(csv_file), mmap)
+    if key not in _heating_profiles_cache:
+        npy_file = os.path.splitext(csv_file)[0] + '.npy'
+        try:
+            if not os.path.isfile(npy_file) or os.path.getmtime(npy_file) < os.path.getmtime(csv_file):
+                _write_heating_profiles_sidecar(csv_file, npy_file)
+            values = np.load(npy_file, mmap_mode='r' if mmap else None)
+        except OSError: # read-only folder
+            values = np.ascontiguousarray(pd.read_csv(csv_file)[BUILDING_TYPES].to_numpy(dtype=float).T)
+        values.setflags(write=False)
+        _heating_profiles_cache[key] = HeatingProfiles(BUILDING_TYPES, values)
+    return _heating_profiles_cache[key]
+
+def _get_rng(rng=None):
+    """Gets the random generator to use, a fresh one if none is given
+
+    Args:
+        rng (numpy.random.Generator, optional): the random generator. Defaults to None.
+
+    Returns:
+        numpy.random.Generator: the random generator to use
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    return rng
+
+def generate_uniform_value_in_dpe(dpe_class, rng=None):
     """Generates a consumption value inside the DPE class
 
     Args:
         dpe_class (str): the DPE class inside ['A', 'B', 'C', 'D', 'E', 'F', 'G']
+        rng (numpy.random.Generator, optional): the random generator. Defaults to None.
 
     Returns:
         float: the value selected
@@ -83,10 +173,10 @@ def generate_uniform_value_in_dpe(dpe_class):
         raise Exception('DPE Class must be inside [A, B, C, D, E, F, G]')
     
     threshold_values = dpe_classes_conso_thresholds[dpe_class]
-    val_selected = np.random.uniform(low=threshold_values[0], high=threshold_values[1])
+    val_selected = _get_rng(rng).uniform(low=threshold_values[0], high=threshold_values[1])
     return val_selected
 
-def _generate_heating_demands_from_percentage_of_total_areas(min_heating_area=min_heating_area, max_heating_area=max_heating_area, verbose=0, one_type_per_subsation=False) -> dict:
+def _generate_heating_demands_from_percentage_of_total_areas(min_heating_area=min_heating_area, max_heating_area=max_heating_area, verbose=0, one_type_per_subsation=False, rng=None) -> dict:
     """Generates heating demand profile for a substation with a random heating area between fixed ranges. Each building type will have a percentage of this pre-selected heating area.
 
     Args:
@@ -94,18 +184,20 @@ def _generate_heating_demands_from_percentage_of_total_areas(min_heating_area=mi
         max_heating_area (float, optional): Maximum heating area. Defaults to max_heating_area.
         verbose (int, optional): Verbosity. Defaults to 0.
         one_type_per_subsation (bool, optional): If true only one type of building per substation, otherwise, it will be a random combinaison of all types. Defaults to False.
+        rng (numpy.random.Generator, optional): the random generator. Defaults to None.
 
     Returns:
         dict: dictionary containing the percentage of each type, profile factors and heating demands of the substation
     """
     
-    heating_profiles = pd.read_csv(os.path.join('src', 'files', 'heating_demands_profiles_v2.csv'))
+    rng = _get_rng(rng)
+    heating_profiles = load_heating_profiles(HEATING_PROFILES_V2_FILE)
     dict_values = {}
     
     # Here
     # We fix total heating area and each building type has its percentage selected randomly
-    heating_surface_area = np.random.uniform(low=min_heating_area, high=max_heating_area) 
-    percentage_by_types = np.random.random(size=4)
+    heating_surface_area = rng.uniform(low=min_heating_area, high=max_heating_area) 
+    percentage_by_types = rng.random(size=4)
     if one_type_per_subsation:
         i = percentage_by_types.argmax()
         for j in range(len(percentage_by_types)):
@@ -135,10 +227,10 @@ def _generate_heating_demands_from_percentage_of_total_areas(min_heating_area=mi
         dict_values[key]['heating_area'] = dict_values[key]['percentage'] * heating_surface_area
         dpe_classes = dpe_classes_names[key]
         dpe_classes_prob = dpe_classes_probabilities[key]
-        class_dpe = list(dpe_classes)[np.random.choice(range(len(dpe_classes)), p=dpe_classes_prob)]
+        class_dpe = list(dpe_classes)[rng.choice(len(dpe_classes), p=dpe_classes_prob)]
         dict_values[key]['class_dpe'] = class_dpe
-        dict_values[key]['mean_E'] = generate_uniform_value_in_dpe(class_dpe) * dict_values[key]['heating_area'] # kWh/year
-        integrated_profiles = sum(heating_profiles[key]) # of the year
+        dict_values[key]['mean_E'] = generate_uniform_value_in_dpe(class_dpe, rng) * dict_values[key]['heating_area'] # kWh/year
+        integrated_profiles = heating_profiles.integrals[key] # of the year
         
         # integral (profile x Factor) = mean energy over the year
         dict_values[key]['profile_factor'] = dict_values[key]['mean_E'] / integrated_profiles # profile factor is in fact in kW
@@ -149,23 +241,25 @@ def _generate_heating_demands_from_percentage_of_total_areas(min_heating_area=mi
     dict_values['total_heating_demand'] = dict_values['COM']['total_heating_demand'] + dict_values['MFH']['total_heating_demand'] + dict_values['SFH']['total_heating_demand']
     return dict_values
 
-def _generate_heating_demands_from_fixed_areas_per_building_types(verbose=0) -> dict:
+def _generate_heating_demands_from_fixed_areas_per_building_types(verbose=0, rng=None) -> dict:
     """Generates heating demand profile for a substation. Each building type has its pre-selected own heating area.
 
     Args:
         verbose (int, optional): Verbosity. Defaults to 0.
+        rng (numpy.random.Generator, optional): the random generator. Defaults to None.
 
     Returns:
         dict: dictionary containing the heating area of each type, profile factors and heating demands of the substation
     """
-    heating_profiles = pd.read_csv(os.path.join('src', 'files', 'heating_demands_profiles.csv'))
+    rng = _get_rng(rng)
+    heating_profiles = load_heating_profiles(HEATING_PROFILES_FILE)
     
     dict_values = {}
     total_area = 0
     for key in area_building_types.keys():
         values = area_building_types[key]
         dict_values[key] = {}
-        dict_values[key]['heating_area'] = np.random.uniform(low=values[0], high=values[1])
+        dict_values[key]['heating_area'] = rng.uniform(low=values[0], high=values[1])
         total_area += dict_values[key]['heating_area']
         
     dpe_classes_probabilities = {}
@@ -181,10 +275,10 @@ def _generate_heating_demands_from_fixed_areas_per_building_types(verbose=0) ->
     for key in dict_values.keys():
         dpe_classes = dpe_classes_names[key]
         dpe_classes_prob = dpe_classes_probabilities[key]
-        class_dpe = list(dpe_classes)[np.random.choice(range(len(dpe_classes)), p=dpe_classes_prob)]
+        class_dpe = list(dpe_classes)[rng.choice(len(dpe_classes), p=dpe_classes_prob)]
         dict_values[key]['class_dpe'] = class_dpe
-        dict_values[key]['mean_E'] = generate_uniform_value_in_dpe(class_dpe) * dict_values[key]['heating_area'] # kWh/year
-        integrated_profiles = sum(heating_profiles[key]) # of the year
+        dict_values[key]['mean_E'] = generate_uniform_value_in_dpe(class_dpe, rng) * dict_values[key]['heating_area'] # kWh/year
+        integrated_profiles = heating_profiles.integrals[key] # of the year
         
         # integral (profile x Factor) = mean energy over the year
         dict_values[key]['profile_factor'] = dict_values[key]['mean_E'] / integrated_profiles # profile factor is in fact in kW
@@ -197,13 +291,14 @@ def _generate_heating_demands_from_fixed_areas_per_building_types(verbose=0) ->
     dict_values['total_heating_demand'] = dict_values['COM']['total_heating_demand'] + dict_values['MFH']['total_heating_demand'] + dict_values['SFH']['total_heating_demand']
     return dict_values
 
-def generate_substation_demands(choice_heating_area, verbose=0, one_type_per_subsation=False) -> dict:
+def generate_substation_demands(choice_heating_area, verbose=0, one_type_per_subsation=False, rng=None) -> dict:
     """Generate a substation heating demand evolution over a year
 
     Args:
         choice_generation (int): 0 for percentage of total fixed heating area and 1 for random heating area per building type
         verbose (int, default=0): 0 no print, 1 print different consumer categories contributions
         one_type_per_subsation(bool, default=False): If True, use only one consumption type per substation otherwise use combinaisions of 3 categories
+        rng (numpy.random.Generator, default=None): the random generator, a fresh one is used if None
         
     Returns:
         dict: substation heating demand including ['total_heating_demand' of COM, MFH and SFH]
@@ -214,13 +309,208 @@ def generate_substation_demands(choice_heating_area, verbose=0, one_type_per_sub
     # two choices here
     if choice_heating_area == 1:
         # 1 - We fix total heating area and each building type has its percentage selected randomly
-        dict_values = _generate_heating_demands_from_percentage_of_total_areas()
+        dict_values = _generate_heating_demands_from_percentage_of_total_areas(rng=rng)
     else:
         # 2 - We have heating areas per building type
-        dict_values = _generate_heating_demands_from_fixed_areas_per_building_types()
+        dict_values = _generate_heating_demands_from_fixed_areas_per_building_types(rng=rng)
 
     return dict_values
 
+class FactorizedLoads(object):
+    """Heating loads of N substations stored as linear combinations of shared base profiles, i.e. an (N x K) coefficients matrix and a (K x hours) base matrix instead of the dense (hours x N) loads. The DPE model loads are exactly of this form with K = 5: the profile factors of the 4 building types and a constant offset.
+    Slices are materialized on demand, and totals, annual energies and peaks are computed from the factors.
+
+    Attributes:
+        coefficients (numpy.ndarray): coefficients of each substation (N x K)
+        base (numpy.ndarray): read-only base profiles (K x hours)
+        labels (List): label of each substation, used as column names (default = 0..N-1)
+    """
+    
+    def __init__(self, coefficients, base, labels=None):
+        """Initializes the FactorizedLoads
+
+        Args:
+            coefficients (numpy.ndarray): coefficients of each substation (N x K)
+            base (numpy.ndarray): base profiles (K x hours)
+            labels (List, optional): label of each substation. Defaults to None, i.e. 0..N-1.
+        """
+        self.coefficients = np.ascontiguousarray(coefficients, dtype=float)
+        self.base = base
+        self.labels = list(range(len(self.coefficients))) if labels is None else list(labels)
+        self._columns = {label: j for j, label in enumerate(self.labels)}
+        
+    @property
+    def shape(self):
+        """Tuple: shape (hours, N) of the dense loads"""
+        return (self.base.shape[1], self.coefficients.shape[0])
+    
+    @property
+    def nbytes(self):
+        """int: memory used by the coefficients, the base profiles being shared"""
+        return self.coefficients.nbytes
+    
+    def window(self, start=0, stop=None, nodes=None):
+        """Materializes the loads of a time window and of some substations
+
+        Args:
+            start (int, optional): first hour. Defaults to 0.
+            stop (int, optional): hour after the last one. Defaults to None, i.e. the end of the year.
+            nodes (array-like, optional): positions of the substations (not labels). Defaults to None, i.e. all.
+
+        Returns:
+            numpy.ndarray: loads (hours x substations)
+        """
+        coefficients = self.coefficients if nodes is None else self.coefficients[nodes]
+        return self.base[:, start:stop].T @ coefficients.T
+    
+    def node(self, label):
+        """Materializes the loads of one substation over the year
+
+        Args:
+            label: label of the substation
+
+        Returns:
+            numpy.ndarray: loads (hours)
+        """
+        return self.base.T @ self.coefficients[self._columns[label]]
+    
+    def __getitem__(self, label):
+        return self.node(label)
+    
+    def __array__(self, dtype=None, copy=None):
+        loads = self.window()
+        return loads if dtype is None else loads.astype(dtype)
+    
+    def to_array(self):
+        """Materializes the dense loads
+
+        Returns:
+            numpy.ndarray: loads (hours x N)
+        """
+        return self.window()
+    
+    def to_dataframe(self, start=0, stop=None):
+        """Materializes the loads of a time window as a table, one column per substation label
+
+        Args:
+            start (int, optional): first hour. Defaults to 0.
+            stop (int, optional): hour after the last one. Defaults to None, i.e. the end of the year.
+
+        Returns:
+            pandas.DataFrame: loads (hours x N)
+        """
+        start, stop, _ = slice(start, stop).indices(self.base.shape[1])
+        return pd.DataFrame(self.window(start, stop), columns=self.labels, index=range(start, stop))
+    
+    def total(self):
+        """Computes the total loads of the substations
+
+        Returns:
+            numpy.ndarray: total loads (hours)
+        """
+        return self.base.T @ self.coefficients.sum(axis=0)
+    
+    def annual_energy(self):
+        """Computes the energy of each substation over the whole period (sum of the hourly loads, kWh for loads in kW)
+
+        Returns:
+            numpy.ndarray: energies (N)
+        """
+        return self.coefficients @ self.base.sum(axis=1)
+    
+    def peaks(self, chunk_size=1024):
+        """Computes the peak load of each substation, materializing at most chunk_size substations at once
+
+        Args:
+            chunk_size (int, optional): number of substations per chunk. Defaults to 1024.
+
+        Returns:
+            numpy.ndarray: peak loads (N)
+        """
+        nb_substations = self.coefficients.shape[0]
+        peaks = np.empty(nb_substations)
+        for start in range(0, nb_substations, chunk_size):
+            nodes = slice(start, min(start + chunk_size, nb_substations))
+            peaks[nodes] = self.window(nodes=nodes).max(axis=0)
+        return peaks
+
+def _sample_dpe_classes(nb_substations, rng):
+    """Draws the DPE class and the consumption value of every building type of every substation at once
+
+    Args:
+        nb_substations (int): number of substations
+        rng (numpy.random.Generator): the random generator
+
+    Returns:
+        Tuple: DPE classes (numpy.ndarray of str, nb_substations x 4) and consumption values in kWh/m2/year (numpy.ndarray, nb_substations x 4)
+    """
+    class_names = np.array(list(dpe_classes_conso_thresholds.keys()))
+    thresholds = np.array(list(dpe_classes_conso_thresholds.values()), dtype=float)
+    classes = np.empty((nb_substations, len(BUILDING_TYPES)), dtype=np.int64)
+    draws = rng.random(size=(nb_substations, len(BUILDING_TYPES)))
+    for k, key in enumerate(BUILDING_TYPES):
+        dpe_classes_prob = np.array([float(distribution_classes_dpe[key][c]) for c in class_names])
+        cumulated_prob = np.cumsum(dpe_classes_prob / np.sum(dpe_classes_prob))
+        classes[:, k] = np.minimum(np.searchsorted(cumulated_prob, draws[:, k], side='right'), len(class_names) - 1) # inverse CDF
+    consumptions = rng.uniform(low=thresholds[classes, 0], high=thresholds[classes, 1])
+    return class_names[classes], consumptions
+
+def generate_substations_demands(nb_substations, choice_heating_area, one_type_per_subsation=False, rng=None, materialize=True) -> dict:
+    """Generates the heating demands of nb_substations substations at once. Same models as *generate_substation_demands*, but areas, percentages, DPE classes and consumption values are drawn for all the substations in a few batched draws, and the loads are given by one matrix product with the base profiles.
+    As in *generate_substation_demands*, the total heating demand sums COM, MFH and SFH demands, and the model with heating areas per building type adds 5 kW per building type to avoid 0 W demands.
+
+    Args:
+        nb_substations (int): number of substations
+        choice_heating_area (int): 1 for percentage of total fixed heating area and 2 for random heating area per building type
+        one_type_per_subsation (bool, optional): If True, use only one building type per substation (percentage model only). Defaults to False.
+        rng (numpy.random.Generator, optional): the random generator, a fresh one is used if None. Defaults to None.
+        materialize (bool, optional): whether to compute the dense loads, otherwise only their factorized form is given. Defaults to True.
+
+    Returns:
+        dict: 'building_types' (list), 'heating_area', 'percentage', 'class_dpe', 'mean_E' and 'profile_factor' (numpy.ndarray, nb_substations x building types), 'loads' (FactorizedLoads) and 'total_heating_demand' (numpy.ndarray, hours x nb_substations, None if not materialized)
+    """
+    rng = _get_rng(rng)
+    nb_types = len(BUILDING_TYPES)
+    
+    if choice_heating_area == 1:
+        # 1 - We fix total heating area and each building type has its percentage selected randomly
+        heating_profiles = load_heating_profiles(HEATING_PROFILES_V2_FILE)
+        heating_surface_area = rng.uniform(low=min_heating_area, high=max_heating_area, size=nb_substations)
+        percentage = rng.random(size=(nb_substations, nb_types))
+        if one_type_per_subsation:
+            percentage = np.where(percentage == percentage.max(axis=1, keepdims=True), percentage, 0.0)
+        percentage /= percentage.sum(axis=1, keepdims=True)
+        heating_area = percentage * heating_surface_area[:, None]
+        offset = 0.0
+    else:
+        # 2 - We have heating areas per building type
+        heating_profiles = load_heating_profiles(HEATING_PROFILES_FILE)
+        bounds = np.array([area_building_types[key] for key in BUILDING_TYPES], dtype=float)
+        heating_area = rng.uniform(low=bounds[:, 0], high=bounds[:, 1], size=(nb_substations, nb_types))
+        percentage = heating_area / heating_area.sum(axis=1, keepdims=True)
+        offset = 5.0 # avoid 0 W demands
+        
+    class_dpe, consumptions = _sample_dpe_classes(nb_substations, rng)
+    mean_E = consumptions * heating_area # kWh/year
+    integrals = np.array([heating_profiles.integrals[key] for key in BUILDING_TYPES])
+    profile_factor = mean_E / integrals # kW
+    
+    # Loads = profile factors x base profiles + offset, the total heating demand being the one of COM, MFH and SFH
+    in_total = np.array([key != 'APPRT' for key in BUILDING_TYPES])
+    coefficients = np.hstack([profile_factor * in_total, np.full((nb_substations, 1), offset * np.count_nonzero(in_total))])
+    loads = FactorizedLoads(coefficients, heating_profiles.base_with_offset)
+    
+    return {
+        'building_types': list(BUILDING_TYPES),
+        'heating_area': heating_area,
+        'percentage': percentage,
+        'class_dpe': class_dpe,
+        'mean_E': mean_E,
+        'profile_factor': profile_factor,
+        'loads': loads,
+        'total_heating_demand': loads.to_array() if materialize else None,
+    }
+
 def get_json_serializable_information(dict_values):
     """Gets only the json serializable information form the subsation dict values, other values can be obtained from these valeus
 
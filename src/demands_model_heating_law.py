@@ -0,0 +1,187 @@
+import sys
+sys.path.insert(0, r'D:\PhD DATA\Codes & Works\SyntheticDHN\SyntheticDHN\src')
+
+import numpy as np
+import os
+import pandas as pd
+
+from src.constants import ANCIENT_BUILDING_U, RECENT_BUILDING_U, OFFICE_BUILDING_U
+
+# Nantes outdoor temperatures of the year 2022 (NASA POWER data)
+NANTES_WEATHER_FILE = os.path.join('src', 'files', 'Nantes_Power_load_data.xlsx')
+
+# Heat exchange coefficient of the building types (ancient building, recent building, office)
+BUILDING_U_FACTORS = np.array([ANCIENT_BUILDING_U, RECENT_BUILDING_U, OFFICE_BUILDING_U])
+
+# Heating law
+REFERENCE_TEMPERATURE = 18.0 # °C, no space heating above
+DESIGN_TEMPERATURE = -6.0 # °C, outdoor temperature of the peak demand
+
+_outdoor_temperatures_cache = {} # Loaded temperature series, indexed by weather file
+
+def _write_outdoor_temperatures_sidecar(excel_file, npy_file):
+    """Converts the weather Excel file into a .npy sidecar file (hour steps and outdoor temperatures rows). The file is written under a temporary name then renamed, so that concurrent workers never read a partial file
+
+    Args:
+        excel_file (str): the weather Excel file
+        npy_file (str): the sidecar file
+
+    Returns:
+        None
+    """
+    df_weather = pd.read_excel(excel_file, sheet_name='Data')
+    values = np.stack([df_weather['HOUR_STEP'].to_numpy(dtype=float), df_weather['T2M'].to_numpy(dtype=float)])
+    tmp_file = f'{npy_file}.{os.getpid()}.tmp'
+    with open(tmp_file, 'wb') as f:
+        np.save(f, values)
+    os.replace(tmp_file, npy_file)
+
+def load_outdoor_temperatures(excel_file=NANTES_WEATHER_FILE):
+    """Loads the hourly outdoor temperatures once per process. The Excel file is parsed once into a .npy sidecar file next to it (rebuilt when the Excel file is newer)
+
+    Args:
+        excel_file (str, optional): the weather Excel file, with 'HOUR_STEP' and 'T2M' columns in its 'Data' sheet. Defaults to NANTES_WEATHER_FILE.
+
+    Returns:
+        Tuple: hour steps (numpy.ndarray of int) and outdoor temperatures in °C (numpy.ndarray), both read-only
+    """
+    key = os.path.abspath(excel_file)
+    if key not in _outdoor_temperatures_cache:
+        npy_file = os.path.splitext(excel_file)[0] + '.npy'
+        try:
+            if not os.path.isfile(npy_file) or os.path.getmtime(npy_file) < os.path.getmtime(excel_file):
+                _write_outdoor_temperatures_sidecar(excel_file, npy_file)
+            values = np.load(npy_file)
+        except OSError: # read-only folder
+            df_weather = pd.read_excel(excel_file, sheet_name='Data')
+            values = np.stack([df_weather['HOUR_STEP'].to_numpy(dtype=float), df_weather['T2M'].to_numpy(dtype=float)])
+        hours = values[0].astype(int)
+        temperatures = np.ascontiguousarray(values[1])
+        hours.setflags(write=False)
+        temperatures.setflags(write=False)
+        _outdoor_temperatures_cache[key] = (hours, temperatures)
+    return _outdoor_temperatures_cache[key]
+
+class HeatingLawLoads(object):
+    """Heating law loads of N substations, computed on demand for any time window. The hourly sanitary shares are drawn from a dedicated PCG64 stream advanced to the first hour of the window, so any window is identical to the same rows of the whole year and the loads can be generated block by block with bounded memory.
+
+    Attributes:
+        conductance (numpy.ndarray): U.A of each substation in W/K (N)
+        temperatures (numpy.ndarray): hourly outdoor temperatures in °C
+        hours (numpy.ndarray): hour steps of the temperatures
+        labels (List): label of each substation, used as column names (default = 0..N-1)
+    """
+    
+    def __init__(self, conductance, temperatures, seed_sequence, hours=None, labels=None, reference_temperature=REFERENCE_TEMPERATURE, design_temperature=DESIGN_TEMPERATURE):
+        """Initializes the HeatingLawLoads
+
+        Args:
+            conductance (numpy.ndarray): U.A of each substation in W/K (N)
+            temperatures (array-like): hourly outdoor temperatures in °C
+            seed_sequence (numpy.random.SeedSequence): seed of the sanitary shares stream
+            hours (array-like, optional): hour steps of the temperatures. Defaults to None, i.e. 0, 1, ...
+            labels (List, optional): label of each substation. Defaults to None, i.e. 0..N-1.
+            reference_temperature (float, optional): temperature in °C above which there is no space heating. Defaults to 18.
+            design_temperature (float, optional): outdoor temperature in °C of the peak demand. Defaults to -6.
+        """
+        self.conductance = np.asarray(conductance, dtype=float)
+        self.temperatures = np.asarray(temperatures, dtype=float)
+        self.hours = np.arange(len(self.temperatures)) if hours is None else np.asarray(hours)
+        self.labels = list(range(len(self.conductance))) if labels is None else list(labels)
+        self.reference_temperature = reference_temperature
+        self.peak = self.conductance * (reference_temperature - design_temperature)
+        self._seed_sequence = seed_sequence
+        
+    @property
+    def shape(self):
+        """Tuple: shape (hours, N) of the dense loads"""
+        return (len(self.temperatures), len(self.conductance))
+    
+    def window(self, start=0, stop=None, nodes=None):
+        """Computes the loads of a time window and of some substations
+
+        Args:
+            start (int, optional): first hour. Defaults to 0.
+            stop (int, optional): hour after the last one. Defaults to None, i.e. the end of the period.
+            nodes (array-like, optional): positions of the substations (not labels). Defaults to None, i.e. all.
+
+        Returns:
+            numpy.ndarray: loads in kW (hours x substations)
+        """
+        start, stop, _ = slice(start, stop).indices(len(self.temperatures))
+        nb_substations = len(self.conductance)
+        temperatures = self.temperatures[start:stop]
+        
+        # The sanitary shares of the window, one double (one PCG64 step) per hour and substation
+        bit_generator = np.random.PCG64(self._seed_sequence)
+        bit_generator.advance(start * nb_substations)
+        loads = np.empty((stop - start, nb_substations))
+        np.random.Generator(bit_generator).random(out=loads)
+        loads *= 0.3
+        loads += 0.2 # sanitary share, uniform in [0.2, 0.5[
+        loads *= self.peak
+        loads += np.abs(self.reference_temperature - temperatures)[:, None] * self.conductance
+        loads[temperatures >= self.reference_temperature, :] = 0.2 * self.peak
+        loads *= 1e-3 # we use kW for consistency reason
+        return loads if nodes is None else loads[:, nodes]
+    
+    def to_array(self):
+        """Computes the dense loads
+
+        Returns:
+            numpy.ndarray: loads in kW (hours x N)
+        """
+        return self.window()
+    
+    def to_dataframe(self, start=0, stop=None):
+        """Computes the loads of a time window as a table, with the hour steps followed by one column per substation label
+
+        Args:
+            start (int, optional): first hour. Defaults to 0.
+            stop (int, optional): hour after the last one. Defaults to None, i.e. the end of the period.
+
+        Returns:
+            pandas.DataFrame: loads in kW
+        """
+        start, stop, _ = slice(start, stop).indices(len(self.temperatures))
+        df_loads = pd.DataFrame(self.window(start, stop), columns=self.labels, index=range(start, stop))
+        df_loads.insert(loc=0, column='hours', value=self.hours[start:stop])
+        return df_loads
+
+def generate_heating_law_demands(nb_substations, temperatures=None, rng=None, reference_temperature=REFERENCE_TEMPERATURE, design_temperature=DESIGN_TEMPERATURE, hours=None, materialize=True) -> dict:
+    """Generates the heating demands of nb_substations substations with the heating law model, all at once.
+    Each substation gets a building type (ancient, recent or office), an exchange area between 5000 and 12000 m2 and a heat exchange coefficient U around the one of its type. Below the reference temperature, its demand is U.A.(Tref - T) plus a sanitary share between 20% and 50% of its peak demand U.A.(Tref - Tdesign), drawn for each hour. Above, it is 20% of its peak demand.
+
+    Args:
+        nb_substations (int): number of substations
+        temperatures (array-like, optional): hourly outdoor temperatures in °C of any climate and length. Defaults to None, i.e. Nantes 2022 temperatures.
+        rng (numpy.random.Generator, optional): the random generator, a fresh one is used if None. Defaults to None.
+        reference_temperature (float, optional): temperature in °C above which there is no space heating. Defaults to 18.
+        design_temperature (float, optional): outdoor temperature in °C of the peak demand. Defaults to -6.
+        hours (array-like, optional): hour steps of the temperatures. Defaults to None, i.e. the Nantes hour steps or 0, 1, ... for given temperatures.
+        materialize (bool, optional): whether to compute the dense loads, otherwise only their lazy form is given. Defaults to True.
+
+    Returns:
+        dict: 'building_type' (0 ancient, 1 recent, 2 office), 'area' (in 1000 m2), 'u_factor' (numpy.ndarray, nb_substations), 'loads' (HeatingLawLoads) and 'total_heating_demand' (numpy.ndarray in kW, hours x nb_substations, None if not materialized)
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    if temperatures is None:
+        nantes_hours, temperatures = load_outdoor_temperatures()
+        if hours is None:
+            hours = nantes_hours
+
+    building_type = rng.integers(0, 3, size=nb_substations)
+    area = rng.uniform(5, 12, size=nb_substations) # Entre 5000-12000m2 de surface d'echange
+    u_factor = rng.normal(BUILDING_U_FACTORS[building_type], 0.1)
+    # Dedicated stream of the hourly sanitary shares
+    seed_sequence = np.random.SeedSequence(rng.integers(2**63, size=4))
+    loads = HeatingLawLoads(u_factor * area * 1e3, temperatures, seed_sequence, hours=hours, reference_temperature=reference_temperature, design_temperature=design_temperature)
+
+    return {
+        'building_type': building_type,
+        'area': area,
+        'u_factor': u_factor,
+        'loads': loads,
+        'total_heating_demand': loads.to_array() if materialize else None,
+    }
@@ -0,0 +1,350 @@
+""" Training dataset over a collection of generated DHNs (ex: the folder Synthetic_DHNs).
+
+The networks of the folder are indexed once: their nodes and pipes tables are parsed and concatenated into memory-mapped arrays in *.dhn_dataset* and their loads are converted into memory-mapped load stores (see load_store). A sample is a network with its normalized node loads over a time window, read from the mapped files without any table parsing, and batches can be prefetched on a background thread pool.
+"""
+import collections
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.constants import BASE_VALUES, POWER_DEMAND_LOSS_KEY, NORMALIZATION_POWER_KEY
+from src.load_store import LOAD_STORE_DATA_FILE, LOAD_STORE_HEADER_FILE, open_load_store, read_load_store_header, write_load_store
+from src.storage import detect_storage
+
+DATASET_INDEX_FOLDER = '.dhn_dataset'
+DATASET_INDEX_FILE = 'index.json'
+DATASET_INDEX_VERSION = 2
+NODE_FEATURES = ['x', 'y', 'Is source']
+EDGE_FEATURES = ['Diameter', 'h', 'length']
+
+
+def _network_signature(folder: str):
+    """ Lists the size and modification time of the tables files of a generated DHN, so that a changed network is detected
+
+    Args:
+        folder (str): folder of the DHN
+
+    Returns:
+        List: [file name, size, modification time in ns] of each file
+    """
+    signature = []
+    for file in sorted(os.listdir(folder)):
+        path = os.path.join(folder, file)
+        if os.path.isfile(path) and file not in [LOAD_STORE_DATA_FILE, LOAD_STORE_HEADER_FILE] and not file.endswith('.tmp'):
+            stat = os.stat(path)
+            signature.append([file, stat.st_size, stat.st_mtime_ns])
+    return signature
+
+
+def _ensure_load_store(folder: str, storage, dtype=np.float32):
+    """ Converts the loads table of a generated DHN into a load store, unless an up-to-date one exists
+
+    Args:
+        folder (str): folder of the DHN
+        storage (TopologyStorage): storage of the DHN tables
+        dtype (numpy.dtype, optional): dtype of the load store. Defaults to float32.
+
+    Returns:
+        None
+    """
+    header_path = os.path.join(folder, LOAD_STORE_HEADER_FILE)
+    newest_table = max(os.stat(os.path.join(folder, file)).st_mtime_ns for file, _, _ in _network_signature(folder))
+    if os.path.isfile(header_path) and os.stat(header_path).st_mtime_ns >= newest_table:
+        return
+    df_loads = storage.read_tables(['loads'])['loads']
+    # Only the hours and the substations columns (integer labels) are kept, the Excel sheets having their index as a column
+    df_loads = df_loads[[c for c in df_loads.columns if c == 'hours' or (isinstance(c, (int, np.integer)) and not isinstance(c, bool))]]
+    write_load_store(folder, df_loads, dtype=dtype)
+
+
+def collate_samples(samples):
+    """ Gathers samples into one batch, the graphs being merged into one disjoint graph (the nodes of each graph are shifted by the number of nodes of the previous ones)
+
+    Args:
+        samples (List[dict]): samples of DHNDataset
+
+    Returns:
+        dict: 'node_features' (total nodes x features), 'edge_index' (2 x total edges), 'edge_features' (total edges x features), 'loads' (window x total nodes), 'batch' (graph of each node), 'networks' and 'starts' (network name and first hour of each sample)
+    """
+    node_offsets = np.cumsum([0] + [len(sample['node_features']) for sample in samples])
+    return {
+        'node_features': np.concatenate([sample['node_features'] for sample in samples]),
+        'edge_index': np.concatenate([sample['edge_index'] + offset for sample, offset in zip(samples, node_offsets)], axis=1),
+        'edge_features': np.concatenate([sample['edge_features'] for sample in samples]),
+        'loads': np.concatenate([sample['loads'] for sample in samples], axis=1),
+        'batch': np.repeat(np.arange(len(samples)), np.diff(node_offsets)),
+        'networks': [sample['network'] for sample in samples],
+        'starts': np.array([sample['start'] for sample in samples]),
+    }
+
+
+class DHNDataset(object):
+    """ Samples (graph tensors, normalized node loads over a time window) of all the DHNs generated in a folder.
+
+    Attributes:
+        root_folder (str): folder of the generated DHNs
+        window (int): number of hours of the loads of a sample
+        stride (int): number of hours between the starts of two consecutive samples of a network
+        networks (List[str]): names of the indexed networks
+        normalization (dict): base values used to normalize the samples, NORMALIZATION_POWER_KEY giving the demand base in W
+    """
+
+    def __init__(self, root_folder: str = 'Synthetic_DHNs', window: int = 24, stride: int = None, demand_base: float = BASE_VALUES[POWER_DEMAND_LOSS_KEY], dtype=np.float32, rebuild: bool = False, max_open_stores: int = 64, verbose: int = 1):
+        """ Opens the dataset of the DHNs of root_folder, indexing them if the index is missing or outdated
+
+        Args:
+            root_folder (str, optional): folder of the generated DHNs. Defaults to 'Synthetic_DHNs'.
+            window (int, optional): number of hours of the loads of a sample. Defaults to 24.
+            stride (int, optional): number of hours between the starts of two consecutive samples of a network. Defaults to None, i.e. the window (no overlap).
+            demand_base (float, optional): base value in W of the normalized loads. Defaults to BASE_VALUES[POWER_DEMAND_LOSS_KEY].
+            dtype (numpy.dtype, optional): dtype of the samples. Defaults to float32.
+            rebuild (bool, optional): whether to index the networks again. Defaults to False.
+            max_open_stores (int, optional): number of load stores kept open, the least recently used ones being closed (each one holds a file descriptor). Defaults to 64.
+            verbose (int, optional): verbose level. Defaults to 1.
+        """
+        self.root_folder = root_folder
+        self.window = int(window)
+        self.stride = self.window if stride is None else int(stride)
+        self.dtype = np.dtype(dtype)
+        self.normalization = {NORMALIZATION_POWER_KEY: demand_base}
+        self.verbose = verbose
+        self._index_folder = os.path.join(root_folder, DATASET_INDEX_FOLDER)
+        self._max_open_stores = max(1, int(max_open_stores))
+        self._load_stores = collections.OrderedDict() # LRU cache of the open load stores, name -> (LoadStore, column positions)
+        self._load_stores_lock = threading.Lock() # the samples are read by several threads, see iter_batches
+
+        index = None if rebuild else self._read_index()
+        if index is None or index['signatures'] != self._scan_signatures():
+            index = self.build_index()
+        self._open_index(index)
+
+    def _scan_signatures(self):
+        """ Finds the generated DHNs of the root folder
+
+        Returns:
+            dict: network name -> signature of its files
+        """
+        signatures = dict()
+        for name in sorted(os.listdir(self.root_folder)):
+            folder = os.path.join(self.root_folder, name)
+            if name == DATASET_INDEX_FOLDER or not os.path.isdir(folder):
+                continue
+            try:
+                detect_storage(folder)
+            except FileNotFoundError:
+                continue
+            signatures[name] = _network_signature(folder)
+        return signatures
+
+    def _read_index(self):
+        """ Reads the index of the dataset
+
+        Returns:
+            dict: the index, None if missing or of another version
+        """
+        index_path = os.path.join(self._index_folder, DATASET_INDEX_FILE)
+        if not os.path.isfile(index_path):
+            return None
+        with open(index_path) as f:
+            index = json.load(f)
+        return index if index.get('version') == DATASET_INDEX_VERSION else None
+
+    def build_index(self):
+        """ Indexes every generated DHN of the root folder: their nodes and pipes are concatenated into memory-mapped arrays and their loads converted into load stores. The index file is written last, so that an interrupted indexing is done again.
+
+        Returns:
+            dict: the index
+        """
+        signatures = self._scan_signatures()
+        networks, node_features, edge_index, edge_features = [], [], [], []
+        for name in signatures:
+            folder = os.path.join(self.root_folder, name)
+            if self.verbose:
+                print(f'Indexing {name} ...')
+            storage = detect_storage(folder)
+            tables = storage.read_tables(['nodes', 'pipes'])
+            df_nodes, df_pipes = tables['nodes'], tables['pipes']
+            _ensure_load_store(folder, storage)
+            header = read_load_store_header(folder)
+            signatures[name] = _network_signature(folder)
+
+            node_features.append(df_nodes[NODE_FEATURES].to_numpy(dtype=self.dtype))
+            edge_index.append(np.stack([df_pipes['start node'].to_numpy(dtype=np.int64) - 1, df_pipes['end node'].to_numpy(dtype=np.int64) - 1])) # base 1 in the tables
+            edge_features.append(df_pipes[EDGE_FEATURES].to_numpy(dtype=self.dtype))
+            networks.append({
+                'name': name,
+                'nb_nodes': len(df_nodes),
+                'nb_edges': len(df_pipes),
+                'nb_hours': header['shape'][0],
+                'ordered_columns': header['labels'] == list(range(1, len(df_nodes) + 1)), # the loads columns are the nodes in order (labels 1..N)
+            })
+
+        os.makedirs(self._index_folder, exist_ok=True)
+        index_path = os.path.join(self._index_folder, DATASET_INDEX_FILE)
+        if os.path.isfile(index_path):
+            os.remove(index_path)
+        arrays = {
+            'node_features': np.concatenate(node_features) if networks else np.empty((0, len(NODE_FEATURES)), dtype=self.dtype),
+            'edge_index': np.concatenate(edge_index, axis=1) if networks else np.empty((2, 0), dtype=np.int64),
+            'edge_features': np.concatenate(edge_features) if networks else np.empty((0, len(EDGE_FEATURES)), dtype=self.dtype),
+            'node_offsets': np.cumsum([0] + [network['nb_nodes'] for network in networks]),
+            'edge_offsets': np.cumsum([0] + [network['nb_edges'] for network in networks]),
+        }
+        for name, values in arrays.items():
+            np.save(os.path.join(self._index_folder, f'{name}.npy'), values)
+
+        index = {
+            'version': DATASET_INDEX_VERSION,
+            'node_features': NODE_FEATURES,
+            'edge_features': EDGE_FEATURES,
+            'networks': networks,
+            'signatures': signatures,
+        }
+        tmp_index_path = f'{index_path}.{os.getpid()}.tmp'
+        with open(tmp_index_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_index_path, index_path)
+        return index
+
+    def _open_index(self, index):
+        """ Maps the arrays of the index and computes the number of samples of each network
+
+        Args:
+            index (dict): the index
+
+        Returns:
+            None
+        """
+        self.networks = [network['name'] for network in index['networks']]
+        self.node_feature_names = index['node_features']
+        self.edge_feature_names = index['edge_features']
+        for name in ['node_features', 'edge_index', 'edge_features', 'node_offsets', 'edge_offsets']:
+            setattr(self, f'_{name}', np.load(os.path.join(self._index_folder, f'{name}.npy'), mmap_mode='r'))
+
+        self._ordered_columns = [network['ordered_columns'] for network in index['networks']]
+        nb_hours = np.array([network['nb_hours'] for network in index['networks']], dtype=np.int64)
+        nb_samples = np.maximum(0, (nb_hours - self.window) // self.stride + 1)
+        self._sample_offsets = np.cumsum(np.concatenate([[0], nb_samples]))
+
+    def _open_loads(self, k: int):
+        """ Gets the loads of a network from the LRU cache of the open load stores, opening its store if needed and closing the least recently used one beyond max_open_stores
+
+        Args:
+            k (int): position of the network
+
+        Returns:
+            Tuple: loads (numpy.memmap, hours x substations) and position of the column of each node in the store (None when the columns are the nodes in order)
+        """
+        name = self.networks[k]
+        with self._load_stores_lock:
+            if name in self._load_stores:
+                self._load_stores.move_to_end(name)
+            else:
+                store = open_load_store(os.path.join(self.root_folder, name))
+                positions = None if self._ordered_columns[k] else np.asarray(store.labels, dtype=np.int64) - 1
+                self._load_stores[name] = (store, positions)
+                while len(self._load_stores) > self._max_open_stores:
+                    _, (evicted, _) = self._load_stores.popitem(last=False)
+                    evicted.close() # the loads being read by other threads keep their mapping until they are released
+            store, positions = self._load_stores[name]
+            return store.values, positions
+
+    def close(self):
+        """ Closes the open load stores
+
+        Returns:
+            None
+        """
+        with self._load_stores_lock:
+            for store, _ in self._load_stores.values():
+                store.close()
+            self._load_stores.clear()
+
+    def __len__(self):
+        return int(self._sample_offsets[-1])
+
+    def __getitem__(self, i):
+        """ Reads a sample
+
+        Args:
+            i (int): index of the sample
+
+        Returns:
+            dict: 'network' (name), 'start' (first hour), 'node_features' (nodes x features), 'edge_index' (2 x edges, base 0), 'edge_features' (edges x features) and 'loads' (window x nodes, normalized)
+        """
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f'Sample {i} out of range')
+        k = int(np.searchsorted(self._sample_offsets, i, side='right')) - 1
+        start = int(i - self._sample_offsets[k]) * self.stride
+        name = self.networks[k]
+        n0, n1 = self._node_offsets[k], self._node_offsets[k + 1]
+        e0, e1 = self._edge_offsets[k], self._edge_offsets[k + 1]
+
+        store, positions = self._open_loads(k)
+        scale = 1e3 / self.normalization[NORMALIZATION_POWER_KEY] # loads in kW
+        if positions is None:
+            loads = np.multiply(store[start:start + self.window], scale, dtype=self.dtype)
+        else:
+            loads = np.zeros((self.window, n1 - n0), dtype=self.dtype)
+            loads[:, positions] = store[start:start + self.window] * scale
+        return {
+            'network': name,
+            'start': start,
+            'node_features': self._node_features[n0:n1],
+            'edge_index': self._edge_index[:, e0:e1],
+            'edge_features': self._edge_features[e0:e1],
+            'loads': loads,
+        }
+
+    def denormalize_loads(self, loads):
+        """ Converts normalized loads back to kW
+
+        Args:
+            loads (numpy.ndarray): normalized loads
+
+        Returns:
+            numpy.ndarray: loads in kW
+        """
+        return np.asarray(loads) * (self.normalization[NORMALIZATION_POWER_KEY] / 1e3)
+
+    def get_batch(self, indices):
+        """ Reads and gathers some samples (see collate_samples)
+
+        Args:
+            indices (List[int]): indices of the samples
+
+        Returns:
+            dict: the batch
+        """
+        return collate_samples([self[i] for i in indices])
+
+    def iter_batches(self, batch_size: int = 32, shuffle: bool = True, seed=None, n_threads: int = 4, prefetch: int = 4, drop_last: bool = False):
+        """ Iterates over the batches of one epoch, the next batches being read on a background thread pool while the current one is used
+
+        Args:
+            batch_size (int, optional): number of samples of a batch. Defaults to 32.
+            shuffle (bool, optional): whether to shuffle the samples. Defaults to True.
+            seed (int or numpy.random.Generator, optional): seed of the shuffling. Defaults to None.
+            n_threads (int, optional): number of reading threads. Defaults to 4.
+            prefetch (int, optional): number of batches read in advance. Defaults to 4.
+            drop_last (bool, optional): whether to drop the last incomplete batch. Defaults to False.
+
+        Returns:
+            Iterator[dict]: the batches (see collate_samples)
+        """
+        order = np.random.default_rng(seed).permutation(len(self)) if shuffle else np.arange(len(self))
+        stop = len(order) - len(order) % batch_size if drop_last else len(order)
+        batches = (order[i:i + batch_size] for i in range(0, stop, batch_size))
+        with ThreadPoolExecutor(max_workers=max(1, n_threads)) as executor:
+            futures = collections.deque()
+            for indices in batches:
+                futures.append(executor.submit(self.get_batch, indices))
+                if len(futures) > max(1, prefetch):
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
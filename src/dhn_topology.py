@@ -2,16 +2,55 @@ import sys
 sys.path.insert(0, r'D:\PhD DATA\Codes & Works\SyntheticDHN\SyntheticDHN\src')
 
 from src.graph_generator import GraphDHNGenerator
-from src.demands_model_dpe import generate_substation_demands, get_json_serializable_information
+from src.demands_model_dpe import FactorizedLoads, generate_substations_demands, get_json_serializable_information
+from src.demands_model_heating_law import HeatingLawLoads, generate_heating_law_demands, load_outdoor_temperatures
+from src.storage import EXCEL_STORAGE, get_storage
+from src.load_store import open_load_store, write_load_store
+from src.graph_algorithms import edge_arrays_to_incidence, load_sparse_arrays, save_sparse_arrays, weighted_laplacian
 
 import networkx as nx 
 import os
 import pandas as pd
 import numpy as np
 
-RECENT_BUILDING_U = 0.84 # W.K^1.m^-2
-ANCIENT_BUILDING_U = 3.4
-OFFICE_BUILDING_U = 2.5
+from src.constants import RECENT_BUILDING_U, ANCIENT_BUILDING_U, OFFICE_BUILDING_U
+from src.constants import RHO, NOMINAL_MASS_RATE, DELAY_TIME_KEY, LOSS_PER_TEMPERATURE_KEY
+
+TOPOLOGY_TABLES = ['nodes', 'pipes']
+DEMAND_TABLES = ['consumers', 'consumers(area)', 'consumers(dpe)', 'loads'] # depending on the heating demand model
+NETWORK_MATRICES_FILE = 'network_matrices.npz'
+
+def compute_pipes_dynamics(diameters, lengths, convective_coefficients, mass_rate=NOMINAL_MASS_RATE) -> dict:
+    """Computes the delay time and the heat loss per temperature of pipes, in the same form as their base values (BASE_VALUES[DELAY_TIME_KEY] and BASE_VALUES[LOSS_PER_TEMPERATURE_KEY]), for all the pipes at once. With the default mass rate, the base pipe (d = 0.1 m, length = 10 km) gets a delay time equal to its base value
+
+    Args:
+        diameters (numpy.ndarray): diameters of the pipes (m)
+        lengths (numpy.ndarray): lengths of the pipes (m)
+        convective_coefficients (numpy.ndarray): convective coefficients h of the pipes
+        mass_rate (float, optional): mass rate of the water in the pipes (kg/s). Defaults to NOMINAL_MASS_RATE, the one of the base delay time.
+
+    Returns:
+        dict: DELAY_TIME_KEY (pi.d2.RHO.length / mass rate, in s) and LOSS_PER_TEMPERATURE_KEY (d.length.h) arrays
+    """
+    diameters = np.asarray(diameters, dtype=float)
+    lengths = np.asarray(lengths, dtype=float)
+    return {
+        DELAY_TIME_KEY: np.pi * diameters**2 * RHO * lengths / mass_rate,
+        LOSS_PER_TEMPERATURE_KEY: diameters * lengths * np.asarray(convective_coefficients, dtype=float),
+    }
+
+def load_network_matrices(path: str) -> dict:
+    """Loads the matrices and pipe arrays exported by DHNTopology.export_network_matrices
+
+    Args:
+        path (str): the .npz file or the folder of the DHN
+
+    Returns:
+        dict: 'incidence' and 'laplacian' (scipy.sparse.csr_matrix), 'start_node', 'end_node' (base 0), 'length', 'diameter', 'h', 'laplacian_weights', 'producer_mask', 'substation_mask' and 'node_positions' (numpy.ndarray)
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, NETWORK_MATRICES_FILE)
+    return load_sparse_arrays(path)
 
 class DHNTopology(object):
     """This class contains the DHN graph generated, the topology information and the heating demands of the nodes
@@ -24,6 +63,15 @@ class DHNTopology(object):
         max_d (float, optional): max diameter value of the pipes (m). Defaults to 0.5.
         min_d (float, optional): min diameter value of the pipes (m). Defaults to 0.5.
         max_h (float, optional): max convective coefficient of the pipes with minimum value 0.8. Defaults to 4.
+        rng (numpy.random.Generator, optional): the random generator of pipes and heating demands. Defaults to None, i.e. the generator of dhn_graph.
+        root_folder (str, optional): the folder containing the generated DHNs folders, created if needed. Defaults to "Synthetic_DHNs".
+        storage_format (str, optional): the storage of the nodes, pipes, consumers and loads tables: "excel" (topology.xlsx, limited to 16,384 columns hence about 16k substations), "parquet", "feather" or "hdf5". Defaults to "excel".
+        export_excel (bool, optional): whether to also export topology.xlsx when storage_format is not "excel". Defaults to False.
+        outdoor_temperatures (array-like, optional): hourly outdoor temperatures (°C) used by the heating law model, of any climate and length. Defaults to None, i.e. Nantes 2022 temperatures.
+        stream_window (int, optional): number of hours of the blocks in which the loads are generated and written (ex: 730 for monthly blocks), keeping the memory bounded for very large networks. Defaults to None, i.e. the whole period at once.
+        export_load_store (bool, optional): whether to also write the loads as a memory-mapped float32 store (loads.bin and loads.json), see load_store. Defaults to False.
+        export_matrices (bool, optional): whether to also export the incidence and Laplacian matrices with the pipe arrays in network_matrices.npz, see export_network_matrices. Defaults to False.
+        pipe_dynamics (bool, optional): whether to add the Delay_time and Loss_per_temperature columns to the pipes table, see compute_pipes_dynamics. Defaults to False.
 
     """
     
@@ -34,7 +82,16 @@ class DHNTopology(object):
                  dpe_model_demand_version=1, # used only if the heating demand model is DPE (version 2), more information see demands_model_dpe.py
                  max_h=4, 
                  max_d=0.5, 
-                 min_d=0.05):
+                 min_d=0.05,
+                 rng: np.random.Generator = None,
+                 root_folder: str = 'Synthetic_DHNs',
+                 storage_format: str = EXCEL_STORAGE,
+                 export_excel: bool = False,
+                 outdoor_temperatures=None,
+                 stream_window: int = None,
+                 export_load_store: bool = False,
+                 export_matrices: bool = False,
+                 pipe_dynamics: bool = False):
         
         """ This class contains the DHN graph generated, the topology information and the heating demands of the nodes
 
@@ -46,18 +103,38 @@ class DHNTopology(object):
             max_d (float, optional): max diameter value of the pipes (m). Defaults to 0.5.
             min_d (float, optional): min diameter value of the pipes (m). Defaults to 0.5.
             max_h (float, optional): max convective coefficient of the pipes with minimum value 0.8. Defaults to 4.
+            rng (numpy.random.Generator, optional): the random generator of pipes and heating demands. Defaults to None, i.e. the generator of dhn_graph.
+            root_folder (str, optional): the folder containing the generated DHNs folders, created if needed. Defaults to "Synthetic_DHNs".
+            storage_format (str, optional): the storage of the nodes, pipes, consumers and loads tables: "excel" (topology.xlsx, limited to 16,384 columns hence about 16k substations), "parquet", "feather" or "hdf5". Defaults to "excel".
+            export_excel (bool, optional): whether to also export topology.xlsx when storage_format is not "excel". Defaults to False.
+            outdoor_temperatures (array-like, optional): hourly outdoor temperatures (°C) used by the heating law model, of any climate and length. Defaults to None, i.e. Nantes 2022 temperatures.
+            stream_window (int, optional): number of hours of the blocks in which the loads are generated and written (ex: 730 for monthly blocks), keeping the memory bounded for very large networks. Defaults to None, i.e. the whole period at once.
+            export_load_store (bool, optional): whether to also write the loads as a memory-mapped float32 store (loads.bin and loads.json), see load_store. Defaults to False.
+            export_matrices (bool, optional): whether to also export the incidence and Laplacian matrices with the pipe arrays in network_matrices.npz, see export_network_matrices. Defaults to False.
+            pipe_dynamics (bool, optional): whether to add the Delay_time and Loss_per_temperature columns to the pipes table, see compute_pipes_dynamics. Defaults to False.
 
         """
         
-        self._dhn_name = os.path.join('Synthetic_DHNs', graph_folder_name)
+        self._dhn_name = os.path.join(root_folder, graph_folder_name)
         self._dhn_graph = dhn_graph
         self._nodes_positions = [] # contains nodes sheet information [nbr, x, y, is_prod]
-        self._pipes_properties = [] # contains pipes sheet information [start node, end node, Diameter, h, length] # Diameter may be changed from dimensioning
-        self._outdoor_temperature = dict() # Outdoor temperatures, important only for demands so far
+        self._pipes_properties = None # pipes sheet information (start node, end node, Diameter, h, length and optionally Delay_time, Loss_per_temperature) # Diameter may be changed from dimensioning
+        self._outdoor_temperature = outdoor_temperatures # Outdoor temperatures, important only for demands so far (None for Nantes 2022)
         self._substations_informations = dict()
-        self._loads = dict() # contains loads sheet information demands of each substation over the time
+        self._loads_table = None # contains loads sheet information demands of each substation over the time, see loads
+        self._lazy_loads = None # loads of the demand model (FactorizedLoads or HeatingLawLoads), materialized on demand
+        self._stream_window = stream_window
+        self._export_load_store = export_load_store
+        self._export_matrices = export_matrices
+        self._pipe_dynamics = pipe_dynamics
+        self._tables = dict() # tables of the DHN (name -> (DataFrame, write index)), kept in memory and flushed once to the storage
         self._heating_demand_version = heating_demand_model
         self._dpe_model_version = 1
+        self._storage_format = storage_format
+        self._export_excel = export_excel and storage_format != EXCEL_STORAGE
+        if rng is None:
+            rng = dhn_graph.rng if dhn_graph is not None else np.random.default_rng()
+        self._rng = rng
         
         self.max_convective_coefficient = max_h
         self.min_convective_coefficient = 0.8
@@ -66,7 +143,25 @@ class DHNTopology(object):
         
         self._fill_dhn_information()
         self._generate_heating_demands()
+        self._flush_tables()
         
+    @property
+    def loads(self):
+        """pandas.DataFrame: heating demands of each substation over the time. The loads are only materialized on the first access"""
+        if self._loads_table is None and self._lazy_loads is not None:
+            self._loads_table = self._lazy_loads.to_dataframe()
+        return self._loads_table
+    
+    @property
+    def _loads(self):
+        # Kept for the notebooks using the former attribute
+        return self.loads
+    
+    @property
+    def factorized_loads(self):
+        """FactorizedLoads: factorized heating demands of the DPE model (None for the heating law model), to get slices, totals, energies and peaks without the dense table"""
+        return self._lazy_loads if isinstance(self._lazy_loads, FactorizedLoads) else None
+    
     def _check_not_empty_graph(self):
         """Checks if the DHN graph is not empty
 
@@ -75,11 +170,139 @@ class DHNTopology(object):
         """
         return self._dhn_graph != None
     
-    def _generate_nodes_positions_with_excel_sheet(self, writer_excel):
+    def _set_table(self, name: str, df: pd.DataFrame, index=False):
+        """Keeps one table of the DHN in memory until the next flush
+
+        Args:
+            name (str): name of the table (sheet name in Excel)
+            df (pandas.DataFrame, FactorizedLoads or HeatingLawLoads): the table, loads being materialized when written
+            index (bool, optional): whether to write the index. Defaults to False.
+
+        Returns:
+            None
+        """
+        self._tables[name] = (df, index)
+    
+    def _flush_tables(self, names=None):
+        """Writes the tables kept in memory in the storage of the DHN, and in the Excel export if required.
+        A workbook can only be appended by re-parsing it, so the Excel file is always rewritten at once from memory. The columnar storages only write the given tables and delete the stale demand tables (ex: after a change of heating demand model).
+
+        Args:
+            names (List[str], optional): names of the tables to write. If None, the storage is created from scratch with every table. Defaults to None.
+
+        Returns:
+            None
+        """
+        if not self._check_not_empty_graph():
+            return
+        
+        storages = [get_storage(self._dhn_name, self._storage_format)]
+        if self._export_excel:
+            storages.append(get_storage(self._dhn_name, EXCEL_STORAGE))
+        for storage in storages:
+            partial = names is not None and storage.storage_format != EXCEL_STORAGE and storage.exists()
+            storage.open(mode='a' if partial else 'w')
+            try:
+                if partial:
+                    for name in DEMAND_TABLES:
+                        if name not in self._tables:
+                            storage.delete_table(name)
+                for name, (df, index) in self._tables.items():
+                    if not partial or name in names:
+                        if isinstance(df, (FactorizedLoads, HeatingLawLoads)):
+                            storage.write_table_blocks(name, self._iter_loads_blocks(df), index=index)
+                        else:
+                            storage.write_table(name, df, index=index)
+            finally:
+                storage.close()
+        if self._export_load_store and 'loads' in self._tables and (names is None or 'loads' in names):
+            self.save_load_store()
+        if self._export_matrices and names is None:
+            self.export_network_matrices()
+    
+    def save_load_store(self, dtype=np.float32):
+        """Writes the loads as a memory-mapped store in the folder of the DHN (loads.bin and loads.json), to read any time window or substations without parsing the tables. The lazy loads are written by blocks of stream_window hours.
+
+        Args:
+            dtype (numpy.dtype, optional): float32 or float64. Defaults to float32.
+
+        Returns:
+            str: path of the header file, None if the loads are not generated
+        """
+        if not self._check_not_empty_graph() or 'loads' not in self._tables:
+            return None
+        loads = self._lazy_loads if self._lazy_loads is not None else self._loads_table
+        return write_load_store(self._dhn_name, loads, units='kW', dtype=dtype, block_hours=self._stream_window or loads.shape[0])
+    
+    def export_network_matrices(self, laplacian_weights=None):
+        """Builds once the system of node-method simulators and saves it in network_matrices.npz in the folder of the DHN (see load_network_matrices): the oriented node-pipe incidence matrix (+1 at the start node, -1 at the end node of each pipe), the weighted Laplacian, the pipe arrays and the producer and substation masks
+
+        Args:
+            laplacian_weights (numpy.ndarray, optional): weight of each pipe in the Laplacian. Defaults to None, i.e. the inverse of the pipe lengths.
+
+        Returns:
+            str: path of the .npz file, None if the DHN graph is empty
+        """
+        if not self._check_not_empty_graph():
+            return None
+        df_nodes = self._tables['nodes'][0]
+        df_pipes = self._tables['pipes'][0]
+        nb_nodes = len(df_nodes)
+        start_node = df_pipes['start node'].to_numpy(dtype=np.int64) - 1 # base 1 in the tables
+        end_node = df_pipes['end node'].to_numpy(dtype=np.int64) - 1
+        length = df_pipes['length'].to_numpy(dtype=float)
+        if laplacian_weights is None:
+            laplacian_weights = 1.0 / length
+        incidence = edge_arrays_to_incidence(nb_nodes, start_node, end_node)
+        producer_mask = df_nodes['Is source'].to_numpy() == 1
+        
+        path = os.path.join(self._dhn_name, NETWORK_MATRICES_FILE)
+        os.makedirs(self._dhn_name, exist_ok=True)
+        save_sparse_arrays(path,
+                           incidence=incidence,
+                           laplacian=weighted_laplacian(incidence, laplacian_weights),
+                           start_node=start_node,
+                           end_node=end_node,
+                           length=length,
+                           diameter=df_pipes['Diameter'].to_numpy(dtype=float),
+                           h=df_pipes['h'].to_numpy(dtype=float),
+                           laplacian_weights=np.asarray(laplacian_weights, dtype=float),
+                           **{key.lower(): df_pipes[key].to_numpy(dtype=float) for key in [DELAY_TIME_KEY, LOSS_PER_TEMPERATURE_KEY] if key in df_pipes.columns},
+                           producer_mask=producer_mask,
+                           substation_mask=~producer_mask,
+                           node_positions=df_nodes[['x', 'y']].to_numpy(dtype=float))
+        return path
+    
+    def open_load_store(self, mode='r'):
+        """Opens the memory-mapped store of the loads written by save_load_store
+
+        Args:
+            mode (str, optional): 'r' for read-only views, 'r+' to modify the loads in place or 'c' for copy-on-write. Defaults to 'r'.
+
+        Returns:
+            LoadStore: the loads
+        """
+        return open_load_store(self._dhn_name, mode)
+    
+    def _iter_loads_blocks(self, loads):
+        """Materializes the loads block by block, following stream_window
+
+        Args:
+            loads (FactorizedLoads or HeatingLawLoads): the loads
+
+        Returns:
+            Iterator[pandas.DataFrame]: consecutive time windows of the loads table
+        """
+        nb_hours = loads.shape[0]
+        window = nb_hours if self._stream_window is None else max(1, int(self._stream_window))
+        for start in range(0, nb_hours, window):
+            yield loads.to_dataframe(start, min(start + window, nb_hours))
+    
+    def _generate_nodes_positions_with_excel_sheet(self):
         """Generates the information about the nodes positions and which among them the sources
 
         Args:
-            writer_excel : excel writer
+            None
 
         Returns:
             None
@@ -103,49 +326,51 @@ class DHNTopology(object):
             })
         
         self._nodes_positions = nodes_data_dict
-        # pandas used to generate excel sheet
-        # Create a Pandas Excel writer using XlsxWriter as the engine.
         df_ = pd.DataFrame.from_dict(nodes_data_dict)
-        df_.to_excel(writer_excel, sheet_name='nodes', index=False, index_label=False)
+        self._set_table('nodes', df_)
         
-    def _generate_pipes_properties_with_excel_sheet(self, writer_excel):
-        """Generates the information about the pipes
+    def _generate_pipes_properties_with_excel_sheet(self):
+        """Generates the information about the pipes, as array operations over the whole edge list
 
         Args:
-            writer_excel : excel writer
+            None
 
         Returns:
             None
         """
         
-        node_indices = self._dhn_graph.node_indices
         node_positions = self._dhn_graph.node_positions
-        producer_indices = self._dhn_graph.producer_indices
         g = self._dhn_graph.graph
         
-        pipes_metadata = []
-        for pipe in g.edges():
-            (start_node, end_node) = pipe
-            length = np.linalg.norm(np.array(node_positions[start_node]) - np.array(node_positions[end_node]))
-            h = np.random.uniform(self.min_convective_coefficient, self.max_convective_coefficient)
-            diameter = np.random.uniform(self.min_diameter, self.max_diameter)
-            pipes_metadata.append({
-                'start node': start_node + 1,
-                'end node': end_node + 1,
-                'Diameter': diameter,
-                'h': h,
-                'length': length
-            })
+        edges = np.array(list(g.edges()), dtype=np.int64).reshape(-1, 2)
+        if isinstance(node_positions, dict):
+            positions = np.zeros((max(node_positions) + 1, 2))
+            positions[list(node_positions.keys())] = np.array(list(node_positions.values()), dtype=float)
+        else:
+            positions = np.asarray(node_positions, dtype=float)
+        convective_coefficients = self._rng.uniform(self.min_convective_coefficient, self.max_convective_coefficient, size=len(edges))
+        diameters = self._rng.uniform(self.min_diameter, self.max_diameter, size=len(edges))
+        lengths = np.linalg.norm(positions[edges[:, 0]] - positions[edges[:, 1]], axis=1)
         
-        self._pipes_properties = pipes_metadata
-        df_ = pd.DataFrame.from_dict(pipes_metadata)
-        df_.to_excel(writer_excel, sheet_name='pipes', index=False, index_label=False)
+        df_ = pd.DataFrame({
+            'start node': edges[:, 0] + 1, # in Julia it is base 1
+            'end node': edges[:, 1] + 1,
+            'Diameter': diameters,
+            'h': convective_coefficients,
+            'length': lengths
+        })
+        if self._pipe_dynamics:
+            for key, values in compute_pipes_dynamics(diameters, lengths, convective_coefficients).items():
+                df_[key] = values
         
-    def _generate_loads_model_dpe(self, writer_excel):
+        self._pipes_properties = df_
+        self._set_table('pipes', df_)
+        
+    def _generate_loads_model_dpe(self):
         """Generates heating demands of the nodes based on DPE distribution model
 
         Args:
-            writer_excel : excel writer
+            None
 
         Returns:
             None
@@ -155,48 +380,34 @@ class DHNTopology(object):
         labels = [int(item)+1 for item in self._dhn_graph.node_indices]
         sorted_labels = labels.copy()
         sorted_labels.sort()
-        dict_substations_heating_areas = []
-        dict_substations_dpe_class = []
-        dict_heating_profiles = {}
+        nb_substations = len(sorted_labels)
         
-        for node in sorted_labels:
-            dict_values = generate_substation_demands(self._dpe_model_version, verbose=0, one_type_per_subsation=False) # can be changed if necessary
-            substation_heating_area_distribution = {
-                'node': node,
-                'COM(%)': dict_values['COM']['percentage'] * 100,
-                'MFH(%)': dict_values['MFH']['percentage'] * 100,
-                'SFH(%)': dict_values['SFH']['percentage'] * 100,
-                'APPRT(%)': dict_values['APPRT']['percentage'] * 100,
-                'Total area(m2)': dict_values['COM']['percentage'] + dict_values['MFH']['heating_area'] + dict_values['SFH']['heating_area'] + dict_values['APPRT']['heating_area']
-            }
-            dict_substations_heating_areas.append(substation_heating_area_distribution)
-            substation_dpe_class = {
-                'node': node,
-                'COM': dict_values['COM']['class_dpe'],
-                'MFH': dict_values['MFH']['class_dpe'],
-                'SFH': dict_values['SFH']['class_dpe'],
-                'APPRT': dict_values['APPRT']['class_dpe'],
-            }
-            dict_substations_dpe_class.append(substation_dpe_class)
-            
-            dict_heating_profiles[node] = dict_values['total_heating_demand']
-            
-        df_cons = pd.DataFrame.from_dict(dict_substations_heating_areas)
-        df_cons.to_excel(writer_excel, sheet_name='consumers(area)', index=False, index_label=False)
+        # All the substations are drawn at once, loads given by one matrix product with the base profiles
+        demands = generate_substations_demands(nb_substations, self._dpe_model_version, one_type_per_subsation=False, rng=self._rng, materialize=False) # can be changed if necessary
+        building_types = demands['building_types']
         
-        df_cons = pd.DataFrame.from_dict(dict_substations_dpe_class)
-        df_cons.to_excel(writer_excel, sheet_name='consumers(dpe)', index=False, index_label=False)
+        df_cons = pd.DataFrame(demands['percentage'] * 100, columns=[f'{key}(%)' for key in building_types])
+        df_cons.insert(loc=0, column='node', value=sorted_labels)
+        df_cons['Total area(m2)'] = demands['heating_area'].sum(axis=1)
+        self._set_table('consumers(area)', df_cons)
         
-        df_loads = pd.DataFrame.from_dict(dict_heating_profiles)
-        df_loads.to_excel(writer_excel, sheet_name='loads', index=True, index_label=True)
+        df_cons = pd.DataFrame(demands['class_dpe'], columns=building_types)
+        df_cons.insert(loc=0, column='node', value=sorted_labels)
+        self._set_table('consumers(dpe)', df_cons)
         
-        self._loads = df_loads
+        # Loads kept factorized (N x 5 coefficients), the dense table is only built when written or accessed
+        loads = demands['loads']
+        loads.labels = sorted_labels
+        self._set_table('loads', loads, index=True)
+        
+        self._lazy_loads = loads
+        self._loads_table = None
                 
-    def _generate_loads_model_heating_law(self, writer_excel):
+    def _generate_loads_model_heating_law(self):
         """Generates heating demands of the nodes based on heating law model. It can be attained with *loads* parameter of the class.
 
         Args:
-            writer_excel : excel writer
+            None
 
         Returns:
             None
@@ -206,51 +417,33 @@ class DHNTopology(object):
         labels = [int(item)+1 for item in self._dhn_graph.node_indices]
         sorted_labels = labels.copy()
         sorted_labels.sort()
-        cons_metadata = []
-        df_loads = pd.DataFrame()
-        df_nantes_data = pd.read_excel(os.path.join('src', 'files', 'Nantes_Power_load_data.xlsx'), sheet_name=['Data'])['Data']
-        temps = np.array(df_nantes_data['T2M'], dtype=float)
-        hours = np.array(df_nantes_data['HOUR_STEP'], dtype=int)
-        df_loads.insert(loc=0, column='hours', value=hours)
-        loads = []
-        for n in sorted_labels:
-            loads_n = np.ones_like(temps)
-            area = 0
-            u = 0
-            gen_f = 0
-            is_space_heating = 0
-            is_industrial_heating = 0
-            
-            is_space_heating = 1
-            id = np.random.choice([0, 1, 2])
-            area = np.random.uniform(5,12) # Entre 5000-12000m2 de surface d'echange
-            if id == 0: # ancient building
-                u = np.random.default_rng().normal(ANCIENT_BUILDING_U, 0.1)
-            elif id == 1:
-                u = np.random.default_rng().normal(RECENT_BUILDING_U, 0.1)
-            else:
-                u = np.random.default_rng().normal(OFFICE_BUILDING_U, 0.1)
-            peak = u*area*1e3*(18+6)
-            for t in range(len(loads_n)):
-                if temps[t] >= 18.0:
-                    loads_n[t] = 0.2*peak
-                else:
-                    sanitary_shape = np.random.uniform(2,5)*0.1
-                    loads_n[t] = u*area*1e3*np.abs(18.0-temps[t]) + sanitary_shape*peak    
-
-            cons_metadata.append([n, area, u, gen_f, is_space_heating, is_industrial_heating])
-            loads.append(loads_n * 1e-3) # we use kW for consistency reason
-            
-        df_cons = pd.DataFrame(cons_metadata, columns=['nbr', 'surface area', 'U factor', 'Gen-factor', 'Space heating', 'Industrial use'])
-        nn_loads = pd.DataFrame(np.array(loads).T, columns=sorted_labels)
-        df_loads = pd.concat([df_loads, nn_loads], axis=1)
-        df_cons.to_excel(writer_excel, sheet_name='consumers', index=False, index_label=False)
-        df_loads.to_excel(writer_excel, sheet_name='loads', index=False, index_label=False)
+        if self._outdoor_temperature is None:
+            hours, temps = load_outdoor_temperatures()
+        else:
+            temps = np.asarray(self._outdoor_temperature, dtype=float)
+            hours = np.arange(len(temps))
         
-        self._loads = df_loads
+        # All the substations are drawn at once, the loads being computed when written or accessed
+        nb_substations = len(sorted_labels)
+        demands = generate_heating_law_demands(nb_substations, temperatures=temps, rng=self._rng, hours=hours, materialize=False)
+        df_cons = pd.DataFrame({
+            'nbr': sorted_labels,
+            'surface area': demands['area'],
+            'U factor': demands['u_factor'],
+            'Gen-factor': np.zeros(nb_substations, dtype=int),
+            'Space heating': np.ones(nb_substations, dtype=int),
+            'Industrial use': np.zeros(nb_substations, dtype=int),
+        })
+        loads = demands['loads']
+        loads.labels = sorted_labels
+        self._set_table('consumers', df_cons)
+        self._set_table('loads', loads)
+        
+        self._lazy_loads = loads
+        self._loads_table = None
         
     def _fill_dhn_information(self):
-        """Creates the topology excel file and fills the information about the nodes and the pipes
+        """Fills the information about the nodes and the pipes in the DHN tables
 
         Args: 
             None
@@ -259,17 +452,8 @@ class DHNTopology(object):
             None  
         """
         if self._check_not_empty_graph():
-            
-            folder = self._dhn_name
-            if not os.path.exists(folder):
-                os.mkdir(folder)
-            
-            excel_file = os.path.join(folder, 'topology.xlsx')
-
-            writer = pd.ExcelWriter(excel_file, engine='openpyxl', mode='w')
-            self._generate_nodes_positions_with_excel_sheet(writer)
-            self._generate_pipes_properties_with_excel_sheet(writer)
-            writer.close()
+            self._generate_nodes_positions_with_excel_sheet()
+            self._generate_pipes_properties_with_excel_sheet()
     
     def _generate_heating_demands(self):
         """Generates heating demands values of the nodes of the DHN generated
@@ -278,27 +462,24 @@ class DHNTopology(object):
             None
 
         Raises:
-            Exception: raise exception if no graph has been created and the topology excel file is not present
+            Exception: raise exception if no graph has been created and the topology tables are not filled
 
         Returns: 
             None
         """
         if self._check_not_empty_graph(): 
-            excel_file = os.path.join(self._dhn_name, 'topology.xlsx')
-            if not os.path.exists(excel_file):
-                raise Exception('Excel file not found! Create first excel topology!')
+            if not all(name in self._tables for name in TOPOLOGY_TABLES):
+                raise Exception('Topology tables not found! Create first the topology!')
             
-            
-            writer = pd.ExcelWriter(excel_file, engine='openpyxl', mode='a', if_sheet_exists='replace')
+            for name in DEMAND_TABLES:
+                self._tables.pop(name, None)
             if self._heating_demand_version == 1:
-                self._generate_loads_model_heating_law(writer)
+                self._generate_loads_model_heating_law()
             elif self._heating_demand_version == 2:
-                self._generate_loads_model_dpe(writer)
-                
-            writer.close()
+                self._generate_loads_model_dpe()
         
     def regenerate_heating_demands(self, model_demand_version: int = 2):
-        """Regenerates the heating deùands if the heating model has been changed
+        """Regenerates the heating deùands if the heating model has been changed. Only the demand tables are written again, the topology tables being kept in memory.
 
         Args:
             model_demand_version (int, optional): the new heating demand model version to use. Defaults to 2.
@@ -309,3 +490,4 @@ class DHNTopology(object):
         if model_demand_version != self._heating_demand_version:
             self._heating_demand_version = model_demand_version
             self._generate_heating_demands()
+            self._flush_tables(names=DEMAND_TABLES)
@@ -0,0 +1,367 @@
+import sys
+sys.path.insert(0, r'D:\PhD DATA\Codes & Works\SyntheticDHN\SyntheticDHN\src')
+
+import networkx as nx
+import os
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import dijkstra
+
+
+class DisjointSet(object):
+    """ Union-find structure (path halving and union by size) used to track the connected components of a graph while it is built.
+
+    Attributes:
+        nb_components (int): Current number of disjoint components
+    """
+
+    def __init__(self, n: int):
+        """ Initializes the DisjointSet with n singleton components
+
+        Args:
+            n (int): Number of elements (labelled from 0 to n-1)
+        """
+        self._parent = np.arange(n, dtype=np.int64)
+        self._size = np.ones(n, dtype=np.int64)
+        self.nb_components = n
+
+    def find(self, x: int) -> int:
+        """ Finds the representative of the component containing x
+
+        Args:
+            x (int): Element
+
+        Returns:
+            int: representative of the component
+        """
+        parent = self._parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return int(x)
+
+    def union(self, x: int, y: int) -> bool:
+        """ Merges the components containing x and y
+
+        Args:
+            x (int): First element
+            y (int): Second element
+
+        Returns:
+            bool: True if two distinct components were merged, False if x and y were already connected
+        """
+        rx = self.find(x)
+        ry = self.find(y)
+        if rx == ry:
+            return False
+        if self._size[rx] < self._size[ry]:
+            rx, ry = ry, rx
+        self._parent[ry] = rx
+        self._size[rx] += self._size[ry]
+        self.nb_components -= 1
+        return True
+
+    def components(self):
+        """ Gets the members of each component
+
+        Returns:
+            List[numpy.ndarray]: list of the elements of each component
+        """
+        roots = np.array([self.find(x) for x in range(len(self._parent))], dtype=np.int64)
+        order = np.argsort(roots, kind='stable')
+        _, starts = np.unique(roots[order], return_index=True)
+        return np.split(order, starts[1:])
+
+
+def graph_to_edge_arrays(G, weight='weight', default=1.0):
+    """ Converts a graph into edge arrays, the nodes being relabelled from 0 following the graph nodes order
+
+    Args:
+        G (networkx.Graph): Graph to convert
+        weight (str): Edge attribute exported as weight (default = 'weight')
+        default (float): Weight of the edges without this attribute (default = 1.0)
+
+    Returns:
+        Tuple: nodes (list), sources (numpy.ndarray), targets (numpy.ndarray), weights (numpy.ndarray)
+    """
+    nodes = list(G.nodes())
+    index_of = {node: i for i, node in enumerate(nodes)}
+    m = G.number_of_edges()
+    sources = np.empty(m, dtype=np.int64)
+    targets = np.empty(m, dtype=np.int64)
+    weights = np.empty(m, dtype=float)
+    for k, (u, v, w) in enumerate(G.edges(data=weight, default=default)):
+        sources[k] = index_of[u]
+        targets[k] = index_of[v]
+        weights[k] = w
+    return nodes, sources, targets, weights
+
+
+def graph_from_edge_arrays(nb_nodes, sources, targets, weights=None, attributes=None):
+    """ Builds a networkx graph with the nodes 0..nb_nodes-1 (in this order) from edge arrays, in a single pass
+
+    Args:
+        nb_nodes (int): Number of nodes
+        sources (numpy.ndarray): Edges sources
+        targets (numpy.ndarray): Edges targets
+        weights (numpy.ndarray, optional): Edges weights, stored as 'weight' attribute (default = None)
+        attributes (dict, optional): Other edges attributes, as arrays indexed by their names (default = None)
+
+    Returns:
+        networkx.Graph: the graph
+    """
+    G = nx.Graph()
+    G.add_nodes_from(range(nb_nodes))
+    attributes = dict(attributes or {})
+    if weights is not None:
+        attributes['weight'] = weights
+    if len(attributes) == 0:
+        G.add_edges_from(zip(sources.tolist(), targets.tolist()))
+    else:
+        names = list(attributes.keys())
+        columns = [np.asarray(attributes[name]).tolist() for name in names]
+        G.add_edges_from(zip(sources.tolist(), targets.tolist(), (dict(zip(names, values)) for values in zip(*columns))))
+    return G
+
+
+def edge_arrays_to_csr(nb_nodes, sources, targets, weights=None):
+    """ Builds the symmetric CSR adjacency matrix from edge arrays
+
+    Args:
+        nb_nodes (int): Number of nodes
+        sources (numpy.ndarray): Edges sources
+        targets (numpy.ndarray): Edges targets
+        weights (numpy.ndarray, optional): Edges weights, ones if None (default = None)
+
+    Returns:
+        scipy.sparse.csr_matrix: adjacency matrix
+    """
+    if weights is None:
+        weights = np.ones(len(sources), dtype=float)
+    return sp.csr_matrix((np.concatenate([weights, weights]), (np.concatenate([sources, targets]), np.concatenate([targets, sources]))), shape=(nb_nodes, nb_nodes))
+
+
+def edge_arrays_to_incidence(nb_nodes, sources, targets):
+    """ Builds the oriented node-pipe incidence matrix from edge arrays: +1 at the source and -1 at the target of each edge
+
+    Args:
+        nb_nodes (int): Number of nodes
+        sources (numpy.ndarray): Edges sources
+        targets (numpy.ndarray): Edges targets
+
+    Returns:
+        scipy.sparse.csr_matrix: incidence matrix (nodes x edges)
+    """
+    nb_edges = len(sources)
+    edges = np.arange(nb_edges)
+    data = np.concatenate([np.ones(nb_edges), -np.ones(nb_edges)])
+    return sp.csr_matrix((data, (np.concatenate([sources, targets]), np.concatenate([edges, edges]))), shape=(nb_nodes, nb_edges))
+
+
+def weighted_laplacian(incidence, weights=None):
+    """ Builds the weighted Laplacian A.diag(w).A^T of a graph from its incidence matrix A
+
+    Args:
+        incidence (scipy.sparse.csr_matrix): Incidence matrix (nodes x edges, see *edge_arrays_to_incidence*)
+        weights (numpy.ndarray, optional): Edges weights, ones if None (default = None)
+
+    Returns:
+        scipy.sparse.csr_matrix: Laplacian (nodes x nodes)
+    """
+    if weights is None:
+        weights = np.ones(incidence.shape[1], dtype=float)
+    return (incidence @ sp.diags(weights) @ incidence.T).tocsr()
+
+
+def save_sparse_arrays(file, **arrays):
+    """ Saves dense arrays and CSR matrices in one uncompressed .npz file, each matrix being stored as its data, indices, indptr and shape arrays. The file is written under a temporary name then renamed.
+
+    Args:
+        file (str): Path of the .npz file
+        **arrays (numpy.ndarray or scipy.sparse matrix): Arrays to save, by name
+
+    Returns:
+        None
+    """
+    flat = dict()
+    for name, values in arrays.items():
+        if sp.issparse(values):
+            values = sp.csr_matrix(values)
+            flat.update({f'{name}.data': values.data, f'{name}.indices': values.indices, f'{name}.indptr': values.indptr, f'{name}.shape': np.array(values.shape)})
+        else:
+            flat[name] = np.asarray(values)
+    tmp_file = f'{file}.{os.getpid()}.tmp'
+    with open(tmp_file, 'wb') as f:
+        np.savez(f, **flat)
+    os.replace(tmp_file, file)
+
+
+def load_sparse_arrays(file):
+    """ Loads the arrays and CSR matrices saved by *save_sparse_arrays*
+
+    Args:
+        file (str): Path of the .npz file
+
+    Returns:
+        dict: arrays and matrices, by name
+    """
+    arrays = dict()
+    with np.load(file) as f:
+        for key in f.files:
+            name, _, part = key.partition('.')
+            if part == '':
+                arrays[name] = f[key]
+            elif part == 'shape':
+                arrays[name] = sp.csr_matrix((f[f'{name}.data'], f[f'{name}.indices'], f[f'{name}.indptr']), shape=tuple(f[key]))
+    return arrays
+
+
+def find_short_cycles(G, max_length: int):
+    """ Enumerates every simple cycle of the graph with at most max_length edges, each cycle being reported once.
+    A bounded depth-first search is started from each node and only visits nodes ranked after it, and each cycle is kept in only one of its two orientations, hence the cost is O(n * d^max_length) for maximal degree d, i.e. linear for the bounded degrees of DHNs.
+
+    Args:
+        G (networkx.Graph): Graph to explore
+        max_length (int): Maximal number of edges of the cycles
+
+    Returns:
+        List[List[tuple]]: list of cycles. A cycle is a list of tuple indicating the edges (ex: [(69, 68), (68, 70), (70, 69)])
+    """
+    rank = {node: i for i, node in enumerate(G.nodes())}
+    cycles = []
+    for start in G.nodes():
+        start_rank = rank[start]
+        path = [start]
+        on_path = {start}
+        # Stack of neighbor iterators, one per node of the current path
+        stack = [iter(G[start])]
+        while stack:
+            neighbor = next(stack[-1], None)
+            if neighbor is None:
+                stack.pop()
+                on_path.discard(path.pop())
+                continue
+            if neighbor == start:
+                # Closing edge, kept in one orientation only
+                if len(path) >= 3 and rank[path[1]] < rank[path[-1]]:
+                    cycles.append([(path[i], path[(i + 1) % len(path)]) for i in range(len(path))])
+                continue
+            if rank[neighbor] <= start_rank or neighbor in on_path or len(path) >= max_length:
+                continue
+            path.append(neighbor)
+            on_path.add(neighbor)
+            stack.append(iter(G[neighbor]))
+    return cycles
+
+
+def break_short_cycles(G, cycles):
+    """ Breaks the given cycles by removing one edge per cycle, in place.
+    An edge is a bridge if and only if it lies on no cycle, so while all the edges of a cycle are still present none of them is a bridge and removing one of them cannot disconnect the graph. Cycles already broken by a previous removal are skipped.
+    Within a cycle, the removed edge is the one shared by the largest number of cycles not treated yet, so that one removal breaks as many short cycles as possible.
+
+    Args:
+        G (networkx.Graph): Graph to treat, modified in place
+        cycles (List[List[tuple]]): Cycles to break, as returned by *find_short_cycles*
+
+    Returns:
+        List[tuple]: removed edges
+    """
+    def key(u, v):
+        return (u, v) if (u, v) in shared_by else (v, u)
+
+    shared_by = {}
+    for cycle in cycles:
+        for (u, v) in cycle:
+            if (v, u) in shared_by:
+                u, v = v, u
+            shared_by[(u, v)] = shared_by.get((u, v), 0) + 1
+
+    removed = []
+    for cycle in cycles:
+        edges = [key(u, v) for (u, v) in cycle]
+        intact = all(G.has_edge(u, v) for (u, v) in edges)
+        if intact:
+            (u, v) = max(edges, key=lambda e: shared_by[e])
+            G.remove_edge(u, v)
+            removed.append((u, v))
+        for e in edges:
+            shared_by[e] -= 1
+    return removed
+
+
+def hop_adjacency(G):
+    """ Builds the unweighted CSR adjacency of the graph, used by the hop-distance searches
+
+    Args:
+        G (networkx.Graph): Graph
+
+    Returns:
+        Tuple: nodes (list), index of each node (dict), adjacency (scipy.sparse.csr_matrix)
+    """
+    nodes = list(G.nodes())
+    index_of = {node: i for i, node in enumerate(nodes)}
+    adjacency = nx.to_scipy_sparse_array(G, nodelist=nodes, weight=None, format='csr')
+    return nodes, index_of, sp.csr_matrix(adjacency)
+
+
+def multi_source_bfs(adjacency, sources, limit=np.inf):
+    """ Computes in one breadth-first search the hop distance of every node to its closest source
+
+    Args:
+        adjacency (scipy.sparse.csr_matrix): Unweighted adjacency (see *hop_adjacency*)
+        sources (array-like): Indices of the sources
+        limit (float, optional): Maximal explored distance, farther nodes get an infinite distance (default = inf)
+
+    Returns:
+        numpy.ndarray: distances to the closest source
+    """
+    sources = np.asarray(sources, dtype=np.int64)
+    if len(sources) == 0:
+        return np.full(adjacency.shape[0], np.inf)
+    return dijkstra(adjacency, directed=False, indices=sources, unweighted=True, min_only=True, limit=limit)
+
+
+def place_producers(G, nb_producers: int, min_distance: int, initial_producers=(), rng=None):
+    """ Places heat producers at least min_distance hops apart with greedy farthest-point (k-center) selection.
+    Initial producers are kept in their order when they respect the spacing with the already kept ones. Then, the node farthest from all the kept producers (given by a multi-source BFS, updated incrementally) is added as long as it is at least min_distance hops away, until nb_producers is reached.
+
+    Args:
+        G (networkx.Graph): Connected DHN graph
+        nb_producers (int): Number of heat producers to reach
+        min_distance (int): Minimum distance between two heat producers, measured in hop-distance
+        initial_producers (List[int], optional): Producers proposed by the generation, kept first if possible (default = ())
+        rng (numpy.random.Generator, optional): Random generator used to break ties (default = None)
+
+    Returns:
+        List[int]: labels of the heat producers
+    """
+    rng = np.random.default_rng(rng)
+    nodes, index_of, adjacency = hop_adjacency(G)
+    if len(nodes) == 0:
+        return []
+
+    producers = []
+    for node in initial_producers:
+        i = index_of[node]
+        if i in producers:
+            continue
+        if len(producers) == 0 or multi_source_bfs(adjacency, producers, limit=min_distance)[i] >= min_distance:
+            producers.append(i)
+
+    distances = multi_source_bfs(adjacency, producers)
+    while len(producers) < nb_producers:
+        if len(producers) == 0:
+            candidate = int(rng.integers(len(nodes)))
+        else:
+            farthest = np.max(distances[np.isfinite(distances)]) if np.isfinite(distances).any() else 0
+            if np.isinf(distances).any():
+                candidates = np.flatnonzero(np.isinf(distances)) # Unreachable part of the graph
+            elif farthest >= min_distance:
+                candidates = np.flatnonzero(distances == farthest)
+            else:
+                break
+            candidate = int(rng.choice(candidates))
+        producers.append(candidate)
+        np.minimum(distances, multi_source_bfs(adjacency, [candidate]), out=distances)
+
+    return [nodes[i] for i in producers]
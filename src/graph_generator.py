@@ -2,14 +2,17 @@ import sys
 sys.path.insert(0, r'D:\PhD DATA\Codes & Works\SyntheticDHN\SyntheticDHN\src')
 
 import matplotlib.pyplot as plt
-from random import random
 import networkx as nx
 import numpy as np
 from itertools import product
 import pandas as pd
 import os
+from concurrent.futures import ProcessPoolExecutor
 from src.constants import *
 from src.graph_generator_params import GraphGeneratorParameters
+from src.graph_algorithms import DisjointSet, find_short_cycles, break_short_cycles, place_producers, graph_to_edge_arrays, graph_from_edge_arrays, edge_arrays_to_csr
+from src.layout_engine import compute_layout as compute_dhn_layout
+from src.storage import detect_storage
  
 class GraphDHNGenerator(object):
     """ Main Class to perform random DHN generator
@@ -31,12 +34,68 @@ class GraphDHNGenerator(object):
         if control_params == None:
             control_params = GraphGeneratorParameters()
         self.params = control_params
+        self.rng = np.random.default_rng(control_params.seed) # Single random generator of the whole generation
         self.graph = nx.DiGraph()
         self.producer_indices = []
         self.node_colors = []
         self.node_indices = []
-        self.node_positions = []
+        self.node_positions = None # Computed lazily, see compute_layout
+        self.region_node_indices = {} # Node labels of each generated region
+        self.region_centers = {} # 2D spatial coordinates used as center of each generated region
+        self.nb_region_attempts = 0 # Number of region candidates generated for the last DHN
         self.verbose = verbose
+    
+    @property
+    def node_positions(self):
+        """ 2D spatial coordinates of the nodes. The layout is only computed on the first access (see *compute_layout*), so that topology-only generations never pay for it.
+        """
+        if self._node_positions is None:
+            self.compute_layout()
+        return self._node_positions
+    
+    @node_positions.setter
+    def node_positions(self, positions):
+        self._node_positions = positions
+    
+    def has_layout(self):
+        """ Checks if the nodes positions have already been computed or loaded
+
+        Returns:
+            bool: True if the layout is available, False otherwise
+        """
+        return self._node_positions is not None
+    
+    def compute_layout(self):
+        """ Computes the 2D layout of the generated DHN once, on the accepted graph only, with the layout backend selected in the control parameters.
+
+        Args:
+            None
+
+        Returns:
+            dict: 2D spatial coordinates of the nodes
+        """
+        if self.verbose == 1:
+            print(f'Computing the DHN layout ({self.params.layout_backend}) ...')
+        self._node_positions = compute_dhn_layout(self.graph, backend=self.params.layout_backend, weight='weight', scale=10, seed=self.rng, regions=self.region_node_indices, region_centers=self.region_centers)
+        return self._node_positions
+        
+    def to_edge_arrays(self):
+        """ Gets the edges of the generated DHN as arrays, nodes being labelled from 0 in the graph nodes order
+
+        Returns:
+            Tuple: sources (numpy.ndarray), targets (numpy.ndarray), weights (numpy.ndarray)
+        """
+        _, sources, targets, weights = graph_to_edge_arrays(self.graph)
+        return sources, targets, weights
+    
+    def to_csr(self):
+        """ Gets the weighted adjacency matrix of the generated DHN in CSR format
+
+        Returns:
+            scipy.sparse.csr_matrix: adjacency matrix
+        """
+        sources, targets, weights = self.to_edge_arrays()
+        return edge_arrays_to_csr(self.graph.number_of_nodes(), sources, targets, weights)
         
     def _generate_random_weight(self):
         """ Generates a random weight for an edge using normal distribution given the mean and standard deviation from the control parameters.
@@ -49,43 +108,45 @@ class GraphDHNGenerator(object):
         """
         mean = self.params.edge_weight_mean
         std = self.params.edge_weight_std
-        weight = np.random.default_rng().normal(mean, std)
+        weight = self.rng.normal(mean, std)
         if weight <= 0:
             weight = self.params.edge_weight_mean / 2.0
         return weight
     
+    def _generate_random_weights(self, size):
+        """ Generates random weights for a batch of edges using normal distribution given the mean and standard deviation from the control parameters.
+        
+        Args:
+            size (int): Number of edges
+        
+        Returns:
+            weights (numpy.ndarray): random weight values applied to the edges
+        """
+        weights = self.rng.normal(self.params.edge_weight_mean, self.params.edge_weight_std, size=size)
+        weights[weights <= 0] = self.params.edge_weight_mean / 2.0
+        return weights
+    
     def _check_for_short_cycles(self, G:nx.Graph):
-        """ Checks if the generated graph have short cycles (e.g., cliques). Any short cycle will be broken by randomly removing one edge within this cycle.
+        """ Checks if the generated graph have short cycles (e.g., cliques). Any short cycle will be broken by removing one edge within this cycle, without disconnecting the graph (see *break_short_cycles*).
+        The graph is treated in place, no copy is made.
 
         Args:
             G (networkx.Graph): Generated graph
 
         Returns:
-            G_to_use (networkx.Graph): Generated graph treated
+            G (networkx.Graph): Generated graph treated
         """
-        G_to_use = G.copy()
-        short_cycles = self._get_short_cycles(G_to_use)
-        print(f"Found cycles = {short_cycles}")
-        for cycle in short_cycles:
-            # cycle is a tuple of pair nodes (ex: [(69, 68), (68, 70), (70, 69)])
-            if self.verbose == 1:
-                print(f"Treating the cycle {cycle}")
-            for (u, v) in cycle:
-                g = G_to_use.copy()
-                try:
-                    g.remove_edge(u, v) # edge (u,v) may have been deleted previously from an other loop
-                    if nx.is_connected(g):
-                        G_to_use = g.copy()
-                        if self.verbose == 1:
-                            print(f"Edge ({u},{v}) removed")
-                        break
-                except Exception as ex:
-                    pass
-                
-        return G_to_use
+        short_cycles = self._get_short_cycles(G)
+        if self.verbose == 1:
+            print(f"Found cycles = {short_cycles}")
+        removed_edges = break_short_cycles(G, short_cycles)
+        if self.verbose == 1:
+            for (u, v) in removed_edges:
+                print(f"Edge ({u},{v}) removed")
+        return G
     
     def _get_short_cycles(self, G:nx.Graph):
-        """ Gets the list of short cycles.
+        """ Gets the list of all the short cycles, i.e. with at most *min_cycle_length* edges.
 
         Args:
             G (networkx.Graph): Generated graph to treat
@@ -93,24 +154,7 @@ class GraphDHNGenerator(object):
         Returns:
             short_cycles (List[tuple]): List of cycles. A cycle is a list of tuple indicating the edges.
         """
-
-        short_cycles = []
-        try:
-            cycles = {}
-            for n in list(G.nodes()):
-                cl = nx.find_cycle(G, source=n)
-                key = f'{cl[0][0]}_{cl[0][1]}'
-                cycles[key] = cl
-                
-            for cl in cycles:
-                cycle_tuple_list = list(cycles[cl])
-                if len(cycle_tuple_list) <= self.params.min_cycle_length:
-                    short_cycles.append(cycle_tuple_list)
-                    print(f"cycle found {cycle_tuple_list}")
-        except Exception:
-            pass
-        
-        return short_cycles
+        return find_short_cycles(G, self.params.min_cycle_length)
 
     def _remove_self_loop(self, G: nx.Graph()):
         """ Removes any self loop.
@@ -126,62 +170,115 @@ class GraphDHNGenerator(object):
             G.remove_edge(u, v)
         return G
 
-    def _generate_random_graph(self, G, remaining_nodes, jump_node_num, max_degree, node_num):
-        """ This function performs our proposed node-recursive graph generation.
+    def _generate_random_graph(self, n, jump_node_num, max_degree, node_num=0):
+        """ This function performs our proposed node-adding graph generation iteratively, with preallocated arrays instead of recursion.
+        Each visited node draws between 1 and (max_degree - 1) neighbors among the remaining nodes, which are removed from the pool in O(1) by swapping with the last remaining node.
 
         Args:
-            G (networkx.Graph): Recursively generated graph
-            remaining_nodes (int): Number of remaining nodes to add (N - Size(G))
+            n (int): Number of nodes to add
             jump_node_num (int): Number used to jump the labels of the nodes added
             max_degree (int): Maximum degree of the nodes added
-            node_num (int): Label of the current node to add
+            node_num (int): Label of the first node to visit (default = 0)
 
         Returns: 
-            G (networkx.Graph) or None
+            Tuple: sources (numpy.ndarray), targets (numpy.ndarray) of the generated edges
         """
-        if not remaining_nodes:
-            return G
+        remaining_nodes = np.arange(n, dtype=np.int64)
+        nb_remaining = n
+        sources = np.empty(n, dtype=np.int64)
+        targets = np.empty(n, dtype=np.int64)
+        # Each remaining node is picked exactly once, hence at most n visited nodes and n picks
+        nb_neighbors = self.rng.integers(1, max_degree, size=n)
+        picks = self.rng.random(size=n)
+        
+        nb_edges = 0
+        step = 0
         current_node = node_num
-        for _ in range(np.random.randint(1, max_degree)):
-            try:
-                neighbor = np.random.choice(remaining_nodes)
-                G.add_edge(current_node, neighbor, weight=self._generate_random_weight())
-                remaining_nodes.remove(neighbor)
-            except Exception:
-                break
+        while nb_remaining > 0:
+            for _ in range(nb_neighbors[step]):
+                if nb_remaining == 0:
+                    break
+                idx = int(picks[nb_edges] * nb_remaining)
+                sources[nb_edges] = current_node
+                targets[nb_edges] = remaining_nodes[idx]
+                nb_remaining -= 1
+                remaining_nodes[idx] = remaining_nodes[nb_remaining]
+                nb_edges += 1
+            current_node += jump_node_num
+            step += 1
         
-        n = node_num + jump_node_num
-        self._generate_random_graph(G, remaining_nodes, jump_node_num, max_degree, n)
+        return sources[:nb_edges], targets[:nb_edges]
 
-    def _generate_region_graph(self, center, n):
-        """ Here, we generate a DHN region using the proposed nodes-recursive graph generation.
+    def _connect_components(self, G: nx.Graph, max_degree):
+        """ Connects the components of the generated graph using a disjoint-set component tracker.
+        Components are visited in random order and each one is joined to the already connected nodes through one edge between two degree-eligible (degree < max_degree) representatives.
+        If a side has no eligible node left, the degree cap is relaxed for this edge only so that the repair always terminates.
+
+        Args:
+            G (networkx.Graph): Generated graph, possibly not connected
+            max_degree (int): Maximum degree of the nodes
+
+        Returns:
+            G (networkx.Graph): Connected graph
+        """
+        nodes = np.fromiter(G.nodes(), dtype=np.int64, count=G.number_of_nodes())
+        if len(nodes) == 0:
+            return G
+        index_of = {int(node): i for i, node in enumerate(nodes)}
+        components_tracker = DisjointSet(len(nodes))
+        for (u, v) in G.edges():
+            components_tracker.union(index_of[u], index_of[v])
+        if components_tracker.nb_components == 1:
+            return G
+        
+        components = components_tracker.components()
+        order = self.rng.permutation(len(components))
+        weights = self._generate_random_weights(len(components) - 1)
+        connected_nodes = [int(node) for node in nodes[components[order[0]]]]
+        eligible_nodes = [node for node in connected_nodes if G.degree(node) < max_degree]
+        for k, c in enumerate(order[1:]):
+            component = [int(node) for node in nodes[components[c]]]
+            candidates = [node for node in component if G.degree(node) < max_degree]
+            if len(candidates) == 0:
+                candidates = component
+            u = candidates[self.rng.integers(len(candidates))]
+            if len(eligible_nodes) != 0:
+                i = self.rng.integers(len(eligible_nodes))
+                v = eligible_nodes[i]
+            else:
+                i = -1
+                v = connected_nodes[self.rng.integers(len(connected_nodes))]
+            G.add_edge(u, v, weight=weights[k])
+            components_tracker.union(index_of[u], index_of[v])
+            
+            if i >= 0 and G.degree(v) >= max_degree:
+                eligible_nodes[i] = eligible_nodes[-1]
+                eligible_nodes.pop()
+            connected_nodes.extend(component)
+            eligible_nodes.extend(node for node in component if G.degree(node) < max_degree)
+        
+        return G
+
+    def _generate_region_graph(self, n):
+        """ Here, we generate a DHN region using the proposed nodes-adding graph generation. No layout is computed here, see *compute_layout*.
 
         Args:
-            center (tuple[float]): 2D spatial coordinates used as center of the DHN
             n (int): Number of nodes for this region
 
         Returns:
-            Tuple: Graph (networkx.Graph),  pos (List of 2D coordinates of the nodes)
+            Graph (networkx.Graph)
         """
         max_degree = self.params.max_degree
         jump_nd = self.params.jump_node_numm
         max_diameter = self.params.max_diameter
         
         G = nx.Graph()
-        remaining_nodes = list(range(n))
         # Generate the random graph
-        self._generate_random_graph(G, remaining_nodes, jump_nd, max_degree, 0)
+        sources, targets = self._generate_random_graph(n, jump_nd, max_degree, 0)
+        G.add_weighted_edges_from(zip(sources.tolist(), targets.tolist(), self._generate_random_weights(len(sources)).tolist()))
         
-        while not nx.is_connected(G):
-            node1 = np.random.choice(list(G.nodes()))
-            node2 = np.random.choice(list(G.nodes()))
-            if G.degree(node1) >= max_degree or G.degree(node2) >= max_degree or node1 == node2:
-                continue
-            else:
-                G.add_edge(node1, node2)
-
-        for e in iter(nx.selfloop_edges(G)):
-            G.remove_edge(e[0], e[1])
+        G = self._remove_self_loop(G)
+        G = self._connect_components(G, max_degree)
 
         # Ensure that the graph has the desired diameter
         it = 0
@@ -191,14 +288,62 @@ class GraphDHNGenerator(object):
         #     G.add_edge(node1, node2)
         #     it+=1
         
-        pos = nx.kamada_kawai_layout(G, center=center)
-        return G, pos
+        return G
 
-    def generate_random_region_with_target(self, center):
+    def _generate_region_graph_with_target_ratio(self, n, target_ratio):
+        """ Here, we generate a DHN region reaching the targeted ratio (E/(N-1)) by construction.
+        A degree-capped spanning tree is first built with the nodes-adding generation, then exactly round((target_ratio - 1) * (n - 1)) extra edges are added between non-adjacent nodes without common neighbors, so that no triangle is created.
+
+        Args:
+            n (int): Number of nodes for this region
+            target_ratio (float): Targeted ratio of #Edges/(#Nodes - 1)
+
+        Returns:
+            Graph (networkx.Graph)
+        """
+        max_degree = self.params.max_degree
+        jump_nd = self.params.jump_node_numm
+        
+        # Spanning tree: keep only the generated edges joining two different components
+        sources, targets = self._generate_random_graph(n, jump_nd, max_degree, 0)
+        nb_labels = int(max(sources.max(initial=0), targets.max(initial=0))) + 1
+        components_tracker = DisjointSet(nb_labels)
+        G = nx.Graph()
+        G.add_nodes_from(np.unique(np.concatenate([sources, targets])).tolist())
+        tree_edges = [(u, v) for u, v in zip(sources.tolist(), targets.tolist()) if components_tracker.union(u, v)]
+        G.add_weighted_edges_from((u, v, w) for (u, v), w in zip(tree_edges, self._generate_random_weights(len(tree_edges)).tolist()))
+        G = self._connect_components(G, max_degree)
+        
+        nb_nodes = G.number_of_nodes()
+        nb_extra_edges = max(0, int(round((target_ratio - 1) * (nb_nodes - 1))))
+        eligible_nodes = [node for node in G.nodes() if G.degree(node) < max_degree]
+        added = 0
+        attempts = 0
+        max_attempts = 100 * (nb_extra_edges + 1)
+        weights = self._generate_random_weights(nb_extra_edges)
+        while added < nb_extra_edges and len(eligible_nodes) > 1 and attempts < max_attempts:
+            attempts += 1
+            i, j = self.rng.integers(len(eligible_nodes), size=2)
+            u = eligible_nodes[i]
+            v = eligible_nodes[j]
+            if u == v or G.has_edge(u, v) or not set(G[u]).isdisjoint(G[v]):
+                continue
+            G.add_edge(u, v, weight=weights[added])
+            added += 1
+            for k in sorted([i, j], reverse=True):
+                if G.degree(eligible_nodes[k]) >= max_degree:
+                    eligible_nodes[k] = eligible_nodes[-1]
+                    eligible_nodes.pop()
+        
+        if added < nb_extra_edges and self.verbose == 1:
+            print(f'WARNING: only {added} of the {nb_extra_edges} extra edges could be added under the degree and triangle constraints')
+        return G
+
+    def generate_random_region_with_target(self, center=None):
         """ Here, we generate a DHN region using the proposed nodes-recursive graph generation but with a ratio (N/E) targeted than a number of nodes to reach. This target illustrates the tree-likeliness of the generated graph and is defined in the control parameters.
 
         Args:
-            center (tuple[float]): 2D spatial coordinates used as center of the DHN
+            center (tuple[float], optional): 2D spatial coordinates used as center of the DHN. Not used anymore since the layout is computed once on the overall DHN (see *compute_layout*)
 
         Returns:
             Graph (networkx.Graph)
@@ -212,11 +357,15 @@ class GraphDHNGenerator(object):
         #     print('Minimumn number of nodes is 60')
         #     nb = 60
         
-        G, pos = self._generate_region_graph(center, nb)
+        if params.region_generation_mode == 'constructive':
+            self.nb_region_attempts += 1
+            return self._generate_region_graph_with_target_ratio(nb, params.target_ratio)
+        
+        G = self._generate_region_graph(nb)
         ratio = G.number_of_edges() / (G.number_of_nodes() - 1)
         iterr = 0
         while np.abs(ratio - params.target_ratio) > 1e-1 and iterr <= 100:
-            G, pos = self._generate_region_graph(center, nb)
+            G = self._generate_region_graph(nb)
             # if ratio > params.target_ratio:
             #     # recreer un autre graph
             #     # TODO: Remove some edges
@@ -228,15 +377,49 @@ class GraphDHNGenerator(object):
             G = self._remove_self_loop(G)
             ratio = G.number_of_edges() / (G.number_of_nodes() -1)
             iterr += 1
+        self.nb_region_attempts += iterr + 1
         # print(f'Ratio (E/V) = {ratio}')
         return G
     
-    def generate_random_dhn(self):
+    def generate_regions(self, nb_regions):
+        """ Generates the regions of the DHN, concurrently on *n_workers* processes (see the control parameters).
+        Each region draws from its own random stream spawned from the DHN random generator, hence the regions only depend on the seed and not on the number of workers.
+
+        Args:
+            nb_regions (int): Number of regions to generate
+
+        Returns:
+            List[tuple]: for each region, its number of nodes and its edges as arrays (sources, targets, weights), nodes being labelled from 0
+        """
+        seed_sequences = np.random.SeedSequence(self.rng.integers(2**63, size=4)).spawn(nb_regions)
+        n_workers = self.params.n_workers
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
+        n_workers = max(1, min(n_workers, nb_regions))
+
+        if n_workers == 1:
+            results = []
+            for count_graph, seed_sequence in enumerate(seed_sequences):
+                print(f'\tRegion {count_graph+1} ...')
+                results.append(_generate_region_edges(self.params, seed_sequence))
+        else:
+            print(f'\t{nb_regions} regions on {n_workers} processes ...')
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                results = list(executor.map(_generate_region_edges, [self.params]*nb_regions, seed_sequences))
+
+        regions = []
+        for (nb_nodes, sources, targets, weights, nb_attempts) in results:
+            self.nb_region_attempts += nb_attempts
+            regions.append((nb_nodes, sources, targets, weights))
+        return regions
+
+    def generate_random_dhn(self, plot_graph=True):
         """ Generates the overall synthetic DHN relying on the control parameters defined in the input of the class.
         It generates sucessively the regions, add random connections between the regions, select random heat producers and perfoms post processing.
+        The layout is not computed here but lazily on the first access to *node_positions*, so topology-only users can skip it with plot_graph=False.
 
         Args:
-            None (using control parameters)
+            plot_graph (bool): Whether to plot the generated graph, which requires its layout (default = True)
 
         Returns:
             bool: True if the generation didn't yield in any errors, False otherwise
@@ -246,54 +429,50 @@ class GraphDHNGenerator(object):
         center_coordinates_of_trees = [[-1, -1], [1, 1], [-1, 1],[2, 1],[1,2]]
         
         ## OUTPUT Varibales
-        node_colors = [] # Color of nodes
-        labels = {} # Label of nodes
-        positions = [] # Spatial coordinates of nodes
         producers = [] # Producer units indices
-        
-        initial_pos = 0
-        labels_per_graphs = {}    
+        region_centers = {} # Spatial coordinates of the regions centers
+        labels_per_graphs = {} # Node labels of each region
         
         ## GENERATION PROCESS
-        if len(node_colors) != 0:
-            node_colors = [] # Color of nodes
-            labels = {} # Label of nodes
-            positions = [] # Spatial coordinates of nodes
-            producers = [] # Producer units indices
-            labels_per_graphs = {}
-
-        add_central_chp_producer = random() < params.E_central_producer # Un producteur central
-
-        # Main graph for DHN
-        u_graph = nx.Graph()
+        # Each region is kept as offset edge arrays, concatenated once at the end instead of copying the DHN graph at each region
+        edges_sources = []
+        edges_targets = []
+        edges_weights = []
+        bridges = [] # Edges between regions or to the central producer (u, v, weight)
+        nb_nodes = 0
+
+        add_central_chp_producer = self.rng.random() < params.E_central_producer # Un producteur central
+        # Connectivity between regions (one element per region, plus the central producer)
+        regions_tracker = DisjointSet(params.nb_regions + 1)
+        central_element = params.nb_regions
 
         if add_central_chp_producer:
-            labels[0] = str(0)
-            u_graph.add_node(0)
-            positions.append(np.array([np.random.uniform(-1,2), np.random.uniform(-1,2)], dtype=float))
-            node_colors.append('tab:red')
+            nb_nodes = 1
             producers.append(0)
             
         count_graph = 0
-        ii = 0
+        self.nb_region_attempts = 0
         print('Generating each region ...')
+        regions = self.generate_regions(params.nb_regions) # Independent regions, stitched sequentially below
         while count_graph < params.nb_regions:
-            print(f'\tRegion {count_graph+1} ...')
-            if count_graph == len(center_coordinates_of_trees):
-                ii = 0
+            ii = count_graph % len(center_coordinates_of_trees)
             center_position_of_tree = center_coordinates_of_trees[ii]
-            ii+=1
-            last_nd = u_graph.number_of_nodes()
             div_coordinate = np.array(center_position_of_tree, dtype=float)
 
-            G = self.generate_random_region_with_target(div_coordinate)
-            pos = nx.kamada_kawai_layout(G, center=2*div_coordinate, scale=2)
+            nb_region_nodes, sources, targets, weights = regions[count_graph]
+            region_centers[count_graph] = 2*div_coordinate
+            
+            # Region nodes are relabelled from starting_label, following the region nodes order
+            starting_label = nb_nodes
+            edges_sources.append(sources + starting_label)
+            edges_targets.append(targets + starting_label)
+            edges_weights.append(weights)
+            nb_nodes += nb_region_nodes
+            labels_per_graphs[count_graph] = np.arange(starting_label, nb_nodes)
             
-            starting_label = last_nd
-            # print(f'Starting label = {starting_label}')
             # We add distributed source even with central big CHP
-            if count_graph != 0 and np.random.uniform(0, 1) < params.E_region_produce and len(producers) < self.params.number_producers:
-                producer_idx = np.random.randint(starting_label, starting_label + G.number_of_nodes()) # Chose one to be supplier
+            if count_graph != 0 and self.rng.uniform(0, 1) < params.E_region_produce and len(producers) < self.params.number_producers:
+                producer_idx = int(self.rng.integers(starting_label, nb_nodes)) # Chose one to be supplier
                 producers.append(producer_idx)
             
             # Probability of having producer
@@ -302,84 +481,77 @@ class GraphDHNGenerator(object):
             # else:
             #     e_rb = params.E_region_produce
             
-            for n in pos:
-                positions.append(pos[n])
-                node_lab = n + starting_label
-                labels[node_lab] = str(node_lab)
-                if count_graph not in labels_per_graphs:
-                    labels_per_graphs[count_graph] = []
-                labels_per_graphs[count_graph].append(node_lab)
-                
-                if node_lab in producers:
-                    node_colors.append('tab:red')
-                else:
-                    node_colors.append('tab:blue')
-            
-            u_graph = nx.disjoint_union(u_graph, G)
             if add_central_chp_producer:
-                ts = np.random.choice(list(G.nodes()))
-                u_graph.add_edge(0, int(ts)+starting_label, weight=self._generate_random_weight())
+                ts = int(self.rng.choice(labels_per_graphs[count_graph]))
+                bridges.append((0, ts, self._generate_random_weight()))
+                regions_tracker.union(central_element, count_graph)
             else:
                 if count_graph != 0:
-                    id_othr_graph = np.random.choice(labels_per_graphs[count_graph])
+                    id_othr_graph = int(self.rng.choice(labels_per_graphs[count_graph]))
                     if count_graph == 1:
-                        id_prev_graph = np.random.choice(labels_per_graphs[0])
+                        id_prev = 0
                     else:
-                        id_prev_graph = np.random.choice(labels_per_graphs[np.random.randint(0,count_graph-1)])
-                    u_graph.add_edge(id_othr_graph, id_prev_graph, weight=self._generate_random_weight())  
+                        id_prev = int(self.rng.integers(0,count_graph-1))
+                    id_prev_graph = int(self.rng.choice(labels_per_graphs[id_prev]))
+                    bridges.append((id_othr_graph, id_prev_graph, self._generate_random_weight()))
+                    regions_tracker.union(count_graph, id_prev)
             
             count_graph += 1  
         
-        # Verify the number of sources
-        while len(producers) <= self.params.number_producers:
-            producer_idx = np.random.randint(0, len(labels)-1) # Select a number of source
-            if producer_idx not in producers:
-                producers.append(producer_idx)
+        if self.verbose == 1:
+            print(f'\t{self.nb_region_attempts} region candidate(s) generated for {params.nb_regions} region(s)')
         
         it = 0
         looping = False
+        nb_expected_components = 1 if add_central_chp_producer else 2 # the central element is alone without central producer
+        existing_bridges = {(min(u, v), max(u, v)) for (u, v, _) in bridges}
         print('Loop --> adding edges between regions')
         while not looping and it < 10:
             # Random edges connections
             for gi in range(count_graph-1): # Count - 1 = number total
                 for gj in range(gi+1, count_graph-1):
-                    if np.random.uniform() <= params.E_bt_regions_pipes:
-                        u = np.random.choice(labels_per_graphs[gi])
-                        v = np.random.choice(labels_per_graphs[gj])
-                        if u != v and not u_graph.has_edge(u, v):
-                            u_graph.add_edge(u, v)
-            looping = nx.is_connected(u_graph)
+                    if self.rng.uniform() <= params.E_bt_regions_pipes:
+                        u = int(self.rng.choice(labels_per_graphs[gi]))
+                        v = int(self.rng.choice(labels_per_graphs[gj]))
+                        if u != v and (min(u, v), max(u, v)) not in existing_bridges:
+                            bridges.append((u, v, self._generate_random_weight()))
+                            existing_bridges.add((min(u, v), max(u, v)))
+                            regions_tracker.union(gi, gj)
+            looping = regions_tracker.nb_components == nb_expected_components
             it+=1
 
+        # Single assembly of the DHN graph
+        if len(bridges) != 0:
+            bridges_array = np.array(bridges, dtype=float)
+            edges_sources.append(bridges_array[:, 0].astype(np.int64))
+            edges_targets.append(bridges_array[:, 1].astype(np.int64))
+            edges_weights.append(bridges_array[:, 2])
+        u_graph = graph_from_edge_arrays(nb_nodes, np.concatenate(edges_sources), np.concatenate(edges_targets), np.concatenate(edges_weights))
+        labels = {n: str(n) for n in range(nb_nodes)} # Label of nodes
+        labels_per_graphs = {r: nodes.tolist() for r, nodes in labels_per_graphs.items()}
+
         print('\t --> finished')
-        poss = nx.kamada_kawai_layout(u_graph, scale=10, dim=2, weight='weight')
         if nx.is_connected(u_graph):
-            close_producers = []
-            for i in range(len(producers)):
-                prd = producers[i]
-                for j in range(i+1, len(producers)):
-                    prdx = producers[j]
-                    if nx.shortest_path_length(u_graph, prd, prdx) < params.min_distance_bt_producers:
-                        if [prd, prdx] in close_producers or [prdx, prd] in close_producers:
-                            continue
-                        close_producers.append([prd, prdx])
-            
-            for [id1, id2] in close_producers:
-                node_colors[id2] = 'tab:blue'
-                if id2 in producers:
-                    producers.remove(id2)
-                    
-            # print('Close producers = ',close_producers)
             # print('Diameter = ',nx.diameter(u_graph))
             # print('Ratio (E/V) total =',u_graph.number_of_edges() / (u_graph.number_of_nodes() -1))
             u_graph = self._check_for_short_cycles(u_graph)
+            
+            # Producers placement: central and regional producers are kept if well spaced, then completed by farthest-point selection
+            producers = place_producers(u_graph, params.number_producers, params.min_distance_bt_producers, initial_producers=producers, rng=self.rng)
+            if len(producers) < params.number_producers and self.verbose == 1:
+                print(f'WARNING: only {len(producers)} producers can be placed {params.min_distance_bt_producers} hops apart')
+            producer_set = set(producers)
+            node_colors = ['tab:red' if n in producer_set else 'tab:blue' for n in u_graph.nodes()]
             self.graph = u_graph
             self.node_colors = node_colors
             self.node_indices = labels
-            self.node_positions = poss
+            self.node_positions = None
+            self.region_node_indices = labels_per_graphs
+            self.region_centers = region_centers
             self.producer_indices = producers
             print('DHN-based graph generated !')
-            self.plot_district_heating_network()
+            if plot_graph:
+                self.plot_district_heating_network()
             return True
         else:
             print('WARNING!!!! NOT CONNECTED GRAPH !! GENERATE AGAIN')
@@ -389,40 +561,31 @@ class GraphDHNGenerator(object):
         """ Reads and loads generated graph.
 
         Args:
-            excel_file_topology (str): Path of the excel file containing the generated graph topology
+            excel_file_topology (str): Path of the file containing the generated graph topology (topology.xlsx, topology.h5, nodes.parquet or nodes.feather), or of the generated DHN folder, in which case the storage format is detected
             plot_graph (bool): Whether to plot the loaded graph (default = True)
         
         Returns:
-            None
+            None. The pipes attributes (Diameter, h, length) are kept as edges data of the loaded graph
         """
 
         # utiliser "expand graph" pour visualiser graph
-        excel_data = pd.read_excel(excel_file_topology, sheet_name=['nodes', 'pipes'])
-        df_nodes = excel_data['nodes']
-        df_pipes = excel_data['pipes']
+        tables = detect_storage(excel_file_topology).read_tables(['nodes', 'pipes'])
+        df_nodes = tables['nodes']
+        df_pipes = tables['pipes']
         n_nodes = len(df_nodes)
-        n_pipes = len(df_pipes)
-        node_colors = []
-        labels = {}
-        producer_indices = []
-        positions = np.zeros(shape=(n_nodes, 2), dtype=float)
-        adjacency_matrix = np.zeros(shape=(n_nodes, n_nodes), dtype=int)
-        for n in range(n_nodes):
-            positions[n] = np.array([df_nodes.iloc[n]['x'],df_nodes.iloc[n]['y']])
-            labels[n] = n
-            if df_nodes.iloc[n]['Is source'] == 1:
-                node_colors.append('tab:red')
-                producer_indices.append(n)
-            else:
-                node_colors.append('tab:blue')
-            
-        for indx, row in df_pipes.iterrows():
-            st = int(row['start node']) - 1
-            ed = int(row['end node']) - 1
-            adjacency_matrix[st, ed] = 1
-            adjacency_matrix[ed, st] = 1
 
-        self.graph = nx.from_numpy_array(adjacency_matrix)
+        # Whole columns are read at once and the graph is built from the edge list, without any n_nodes x n_nodes matrix
+        positions = df_nodes[['x', 'y']].to_numpy(dtype=float)
+        is_source = df_nodes['Is source'].to_numpy() == 1
+        producer_indices = np.flatnonzero(is_source).tolist()
+        node_colors = np.where(is_source, 'tab:red', 'tab:blue').tolist()
+        labels = {n: n for n in range(n_nodes)}
+
+        sources = df_pipes['start node'].to_numpy(dtype=np.int64) - 1 # base 1 in the tables
+        targets = df_pipes['end node'].to_numpy(dtype=np.int64) - 1
+        pipe_attributes = {name: df_pipes[name].to_numpy() for name in df_pipes.columns if name not in ['start node', 'end node']} # Diameter, h, length
+        
+        self.graph = graph_from_edge_arrays(n_nodes, sources, targets, attributes=pipe_attributes)
         self.producer_indices = producer_indices
         self.node_colors = node_colors
         self.node_indices = labels
@@ -444,15 +607,32 @@ class GraphDHNGenerator(object):
         nx.draw(self.graph, pos=self.node_positions, labels=self.node_indices, node_color=self.node_colors, node_size=200, font_size=12, font_color="black")
         plt.show()
     
-    def generate_random_connected_dhn(self):
+    def generate_random_connected_dhn(self, plot_graph=True):
         """ Redundant function to generate the overall synthetic DHN. It calls the function *self.generate_random_dhn()* and returns None.
 
         Args:
-            None
+            plot_graph (bool): Whether to plot the generated graph, which requires its layout (default = True)
 
         Returns:
             None
         """
         is_generated = False
         while not is_generated:
-            is_generated = self.generate_random_dhn()
\ No newline at end of file
+            is_generated = self.generate_random_dhn(plot_graph=plot_graph)
+
+
+def _generate_region_edges(control_params: GraphGeneratorParameters, seed_sequence):
+    """ Generates one region with its own random stream, used by the process pool of *GraphDHNGenerator.generate_regions*
+
+    Args:
+        control_params (GraphGeneratorParameters): Control parameters of the generation
+        seed_sequence (numpy.random.SeedSequence): Seed of the random stream of the region
+
+    Returns:
+        Tuple: number of nodes, sources (numpy.ndarray), targets (numpy.ndarray), weights (numpy.ndarray), number of region candidates generated
+    """
+    generator = GraphDHNGenerator(control_params, verbose=0)
+    generator.rng = np.random.default_rng(seed_sequence)
+    G = generator.generate_random_region_with_target()
+    _, sources, targets, weights = graph_to_edge_arrays(G)
+    return G.number_of_nodes(), sources, targets, weights, generator.nb_region_attempts
@@ -20,6 +20,10 @@ class GraphGeneratorParameters():
         nb_producers_to_reach (int): Number of heat producers to reach wihin the DHN, we note that it can be not achieved (default = 3)
         edge_weight_mean (float): Mean of the normal distribution used to generate the edges' weights (default = 1.5)
         edge_weight_std (flaot): Standard deviation of the normal distribution used to generate the edges' weights (default = 0.2)
+        region_generation_mode (str): How regions reach the target ratio. 'rejection' regenerates regions until the ratio is close to the target, 'constructive' builds a spanning tree and adds exactly the required extra non-triangle edges (default = 'rejection')
+        layout_backend (str): Layout engine of the DHN. 'kamada_kawai' (dense, limited to a few thousand nodes) 'sparse_stress' (sparse stress majorization, scales to 100k+ nodes) or 'hierarchical' (regions laid out and placed first, then a short global refinement) (default = 'kamada_kawai')
+        seed (int, optional): Seed of the single random generator used by the whole generation (graph, pipes and heating demands). If None, runs are not reproducible (default = None)
+        n_workers (int, optional): Number of processes generating the regions of a DHN concurrently. Each region has its own random stream spawned from the seed, so the generated DHN does not depend on it. If None, one process per region up to the number of cores (default = 1)
 
 
     """
@@ -35,7 +39,11 @@ class GraphGeneratorParameters():
                  min_distance_bt_producers = 3,
                  nb_producers_to_reach = 3,
                  edge_weight_mean = 1.5,
-                 edge_weight_std = 0.2):
+                 edge_weight_std = 0.2,
+                 region_generation_mode = 'rejection',
+                 layout_backend = 'kamada_kawai',
+                 seed = None,
+                 n_workers = 1):
         """ Initializes the GraphGeneratorParameters
         
         Args:
@@ -51,6 +59,10 @@ class GraphGeneratorParameters():
             nb_producers_to_reach (int): Number of heat producers to reach wihin the DHN, we note that it can be not achieved (default = 3)
             edge_weight_mean (float): Mean of the normal distribution used to generate the edges' weights (default = 1.5)
             edge_weight_std (flaot): Standard deviation of the normal distribution used to generate the edges' weights (default = 0.2)s
+            region_generation_mode (str): How regions reach the target ratio. 'rejection' regenerates regions until the ratio is close to the target, 'constructive' builds a spanning tree and adds exactly the required extra non-triangle edges (default = 'rejection')
+            layout_backend (str): Layout engine of the DHN. 'kamada_kawai' (dense, limited to a few thousand nodes) 'sparse_stress' (sparse stress majorization, scales to 100k+ nodes) or 'hierarchical' (regions laid out and placed first, then a short global refinement) (default = 'kamada_kawai')
+            seed (int, optional): Seed of the single random generator used by the whole generation (graph, pipes and heating demands). If None, runs are not reproducible (default = None)
+            n_workers (int, optional): Number of processes generating the regions of a DHN concurrently. Each region has its own random stream spawned from the seed, so the generated DHN does not depend on it. If None, one process per region up to the number of cores (default = 1)
         """
         
         self.E_central_producer = E_cp
@@ -68,3 +80,7 @@ class GraphGeneratorParameters():
         self.edge_weight_mean = edge_weight_mean
         self.edge_weight_std = edge_weight_std
         self.number_producers = nb_producers_to_reach
+        self.region_generation_mode = region_generation_mode
+        self.layout_backend = layout_backend
+        self.seed = seed
+        self.n_workers = n_workers
@@ -0,0 +1,357 @@
+import sys
+sys.path.insert(0, r'D:\PhD DATA\Codes & Works\SyntheticDHN\SyntheticDHN\src')
+
+import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import dijkstra
+from scipy.sparse.linalg import LinearOperator, cg
+
+from src.graph_algorithms import edge_arrays_to_csr, graph_to_edge_arrays
+
+# Available layout backends (see GraphGeneratorParameters.layout_backend)
+KAMADA_KAWAI_LAYOUT = 'kamada_kawai'
+SPARSE_STRESS_LAYOUT = 'sparse_stress'
+HIERARCHICAL_LAYOUT = 'hierarchical'
+
+
+def _graph_to_csr(G: nx.Graph, weight='weight'):
+    """ Converts the graph into a symmetric CSR matrix of edge lengths
+
+    Args:
+        G (networkx.Graph): Graph to convert
+        weight (str): Edge attribute used as edge length, missing values default to 1 (default = 'weight')
+
+    Returns:
+        Tuple: nodes (list), edges sources (numpy.ndarray), edges targets (numpy.ndarray), edges lengths (numpy.ndarray), adjacency (scipy.sparse.csr_matrix)
+    """
+    nodes, sources, targets, lengths = graph_to_edge_arrays(G, weight=weight, default=1.0)
+    keep = sources != targets
+    sources, targets, lengths = sources[keep], targets[keep], lengths[keep]
+    adjacency = edge_arrays_to_csr(len(nodes), sources, targets, lengths)
+    return nodes, sources, targets, lengths, adjacency
+
+
+def _select_pivots(adjacency, nb_pivots, rng):
+    """ Selects pivots with the max-min (farthest point) strategy and returns their shortest path distances to all nodes
+
+    Args:
+        adjacency (scipy.sparse.csr_matrix): Edge lengths matrix
+        nb_pivots (int): Number of pivots
+        rng (numpy.random.Generator): Random generator used to draw the first pivot
+
+    Returns:
+        Tuple: pivots (numpy.ndarray), distances (numpy.ndarray of shape (nb_pivots, n))
+    """
+    n = adjacency.shape[0]
+    nb_pivots = min(nb_pivots, n)
+    pivots = np.empty(nb_pivots, dtype=np.int64)
+    distances = np.empty((nb_pivots, n), dtype=float)
+    pivots[0] = rng.integers(n)
+    min_distances = np.full(n, np.inf)
+    for k in range(nb_pivots):
+        d = dijkstra(adjacency, directed=False, indices=int(pivots[k]))
+        # Disconnected parts are placed just beyond the farthest reachable node
+        finite = np.isfinite(d)
+        d[~finite] = (d[finite].max() if finite.any() else 0.0) + 1.0
+        distances[k] = d
+        np.minimum(min_distances, d, out=min_distances)
+        if k + 1 < nb_pivots:
+            pivots[k + 1] = int(np.argmax(min_distances))
+    return pivots, distances
+
+
+def _pivot_mds(distances):
+    """ Computes initial 2D positions with Pivot MDS (Brandes & Pich, 2006)
+
+    Args:
+        distances (numpy.ndarray): Pivots to nodes distances of shape (nb_pivots, n)
+
+    Returns:
+        numpy.ndarray: positions of shape (n, 2)
+    """
+    squared = distances.T ** 2
+    C = -0.5 * (squared - squared.mean(axis=0, keepdims=True) - squared.mean(axis=1, keepdims=True) + squared.mean())
+    eigenvalues, eigenvectors = np.linalg.eigh(C.T @ C)
+    order = np.argsort(eigenvalues)[::-1][:2]
+    X = C @ eigenvectors[:, order]
+    if X.shape[1] < 2:
+        X = np.hstack([X, np.zeros((X.shape[0], 2 - X.shape[1]))])
+    return X
+
+
+class _SparseStressModel(object):
+    """ Terms of the sparse stress model (Ortmann, Klimenta & Brandes, 2016).
+    Each edge keeps its exact term, and each node is attracted to every pivot with a weight proportional to the size of the pivot region (nodes closer to this pivot than to any other), which stands for the terms of the nodes it represents.
+    Pivot terms are stored as dense (nb_pivots, n) matrices so that every operation is a vectorized broadcast, and the weighted laplacian is only applied matrix-free.
+
+    Attributes:
+        n (int): Number of nodes
+        pivots (numpy.ndarray): Pivots indices
+    """
+
+    def __init__(self, sources, targets, lengths, pivots, distances):
+        """ Initializes the _SparseStressModel
+
+        Args:
+            sources (numpy.ndarray): Edges sources
+            targets (numpy.ndarray): Edges targets
+            lengths (numpy.ndarray): Edges lengths
+            pivots (numpy.ndarray): Pivots indices
+            distances (numpy.ndarray): Pivots to nodes distances of shape (nb_pivots, n)
+        """
+        nb_pivots, n = distances.shape
+        self.n = n
+        self.pivots = pivots
+        self._sources = sources
+        self._targets = targets
+        self._edge_distances = np.where(lengths > 0, lengths, 1.0)
+        self._edge_weights = 1.0 / self._edge_distances ** 2
+
+        region_sizes = np.bincount(np.argmin(distances, axis=0), minlength=nb_pivots).astype(float)
+        with np.errstate(divide='ignore'):
+            self._pivot_weights = np.where(distances > 0, region_sizes[:, None] / distances ** 2, 0.0)
+        self._pivot_weights[np.arange(nb_pivots), pivots] = 0.0
+        self._pivot_distances = distances
+
+        self._edge_adjacency = sp.csr_matrix((np.concatenate([self._edge_weights, self._edge_weights]), (np.concatenate([sources, targets]), np.concatenate([targets, sources]))), shape=(n, n))
+        self._diagonal = np.asarray(self._edge_adjacency.sum(axis=1)).ravel() + self._pivot_weights.sum(axis=0)
+        self._diagonal[pivots] += self._pivot_weights.sum(axis=1)
+
+    def laplacian(self):
+        """ Gets the weighted laplacian of the terms as a matrix-free operator, with its jacobi preconditioner
+
+        Returns:
+            Tuple: laplacian (scipy.sparse.linalg.LinearOperator), preconditioner (scipy.sparse.linalg.LinearOperator)
+        """
+        pivots = self.pivots
+        W = self._pivot_weights
+        pivots_row_sums = W.sum(axis=1)
+
+        def matvec(x):
+            x = np.ravel(x)
+            y = self._diagonal * x - self._edge_adjacency @ x - W.T @ x[pivots]
+            y[pivots] -= W @ x
+            return y
+
+        inverse_diagonal = 1.0 / np.maximum(self._diagonal, 1e-12)
+        L_w = LinearOperator((self.n, self.n), matvec=matvec, dtype=float)
+        M = LinearOperator((self.n, self.n), matvec=lambda x: inverse_diagonal * np.ravel(x), dtype=float)
+        return L_w, M
+
+    def stress_and_guttman_rhs(self, X):
+        """ Computes the stress of the layout and the right-hand side L_Z(X) X of the Guttman transform
+
+        Args:
+            X (numpy.ndarray): Positions of shape (n, 2)
+
+        Returns:
+            Tuple: stress (float), right-hand side (numpy.ndarray of shape (n, 2))
+        """
+        B = np.zeros_like(X)
+
+        difference = X[self._sources] - X[self._targets]
+        euclidean_distances = np.maximum(np.sqrt(np.sum(difference ** 2, axis=1)), 1e-12)
+        stress = np.sum(self._edge_weights * (euclidean_distances - self._edge_distances) ** 2)
+        coefficients = (self._edge_weights * self._edge_distances / euclidean_distances)[:, None] * difference
+        for dim in range(2):
+            B[:, dim] += np.bincount(self._sources, weights=coefficients[:, dim], minlength=self.n) - np.bincount(self._targets, weights=coefficients[:, dim], minlength=self.n)
+
+        dx = X[:, 0][None, :] - X[self.pivots, 0][:, None]
+        dy = X[:, 1][None, :] - X[self.pivots, 1][:, None]
+        euclidean_distances = np.maximum(np.sqrt(dx ** 2 + dy ** 2), 1e-12)
+        stress += np.sum(self._pivot_weights * (euclidean_distances - self._pivot_distances) ** 2)
+        coefficients = self._pivot_weights * self._pivot_distances / euclidean_distances
+        for dim, d in enumerate([dx, dy]):
+            contributions = coefficients * d
+            B[:, dim] += contributions.sum(axis=0)
+            B[self.pivots, dim] -= contributions.sum(axis=1)
+        return float(stress), B
+
+
+def sparse_stress_layout(G: nx.Graph, weight='weight', pos=None, nb_pivots=50, max_iter=100, tol=1e-4, scale=1, center=None, seed=None, cg_iter=5):
+    """ Computes a 2D layout with sparse stress majorization. Only the edges and nb_pivots pivot terms per node are kept, so memory and time per iteration are O(m + n * nb_pivots) instead of O(n²) for Kamada-Kawai.
+    Positions are initialized with Pivot MDS (unless pos is given) and improved by majorization steps, each solving the laplacian system with a few preconditioned conjugate gradient iterations.
+
+    Args:
+        G (networkx.Graph): Graph to lay out
+        weight (str): Edge attribute used as edge length (default = 'weight')
+        pos (dict, optional): Initial positions of the nodes. If None, Pivot MDS is used (default = None)
+        nb_pivots (int): Number of pivots of the sparse stress model. More pivots improve the global shape at a linear cost (default = 50)
+        max_iter (int): Maximum number of majorization iterations (default = 100)
+        tol (float): Relative stress improvement under which the iterations stop (default = 1e-4)
+        scale (float): Scale factor of the positions. If None, positions are kept in edge length units (default = 1)
+        center (array-like, optional): Center of the layout (default = None, i.e. origin)
+        seed (int or numpy.random.Generator, optional): Seed of the pivots selection (default = None)
+        cg_iter (int): Number of conjugate gradient iterations per majorization step (default = 5)
+
+    Returns:
+        dict: 2D spatial coordinates of the nodes
+    """
+    center = np.zeros(2) if center is None else np.asarray(center, dtype=float)
+    n = G.number_of_nodes()
+    if n == 0:
+        return {}
+    if n == 1:
+        return {next(iter(G.nodes())): center.copy()}
+
+    rng = np.random.default_rng(seed)
+    nodes, sources, targets, lengths, adjacency = _graph_to_csr(G, weight)
+    pivots, distances = _select_pivots(adjacency, nb_pivots, rng)
+    if pos is None:
+        X = _pivot_mds(distances)
+    else:
+        X = np.array([pos[node] for node in nodes], dtype=float)
+
+    model = _SparseStressModel(sources, targets, lengths, pivots, distances)
+    L_w, M = model.laplacian()
+    stress, B = model.stress_and_guttman_rhs(X)
+    for _ in range(max_iter):
+        # Guttman transform: solve L_w X = L_Z(X) X
+        for dim in range(2):
+            X[:, dim], _ = cg(L_w, B[:, dim], x0=X[:, dim], maxiter=cg_iter, M=M)
+        new_stress, B = model.stress_and_guttman_rhs(X)
+        converged = stress - new_stress <= tol * stress
+        stress = new_stress
+        if converged:
+            break
+
+    X = X - X.mean(axis=0)
+    if scale is not None:
+        X = nx.rescale_layout(X, scale=scale)
+    return dict(zip(nodes, X + center))
+
+
+def hierarchical_layout(G: nx.Graph, regions: dict, centers: dict = None, weight='weight', refine_iter=15, nb_pivots=50, scale=10, center=None, seed=None):
+    """ Computes a 2D layout of a multi-region DHN by placing the regions first.
+    Each region is laid out on its own (in edge length units), the regions are placed by a stress layout of the region graph whose edge lengths are the sum of the regions radii (initialized from the regions centers), and the stitched positions warm-start a short sparse stress refinement over the whole DHN, which mostly has to adjust the inter-region edges.
+
+    Args:
+        G (networkx.Graph): Graph to lay out
+        regions (dict): Node labels of each region. Nodes not listed in any region (e.g. a central producer) are placed as single-node regions
+        centers (dict, optional): 2D spatial coordinates used as initial center of each region (default = None)
+        weight (str): Edge attribute used as edge length (default = 'weight')
+        refine_iter (int): Number of majorization iterations of the global refinement (default = 15)
+        nb_pivots (int): Number of pivots of the sparse stress layouts (default = 50)
+        scale (float): Scale factor of the positions (default = 10)
+        center (array-like, optional): Center of the layout (default = None, i.e. origin)
+        seed (int or numpy.random.Generator, optional): Seed of the pivots selection (default = None)
+
+    Returns:
+        dict: 2D spatial coordinates of the nodes
+    """
+    rng = np.random.default_rng(seed)
+    centers = {} if centers is None else centers
+    region_of = {}
+    region_nodes = {}
+    for r, nodes in regions.items():
+        region_nodes[('region', r)] = [node for node in nodes if node in G]
+    for r, nodes in region_nodes.items():
+        for node in nodes:
+            region_of[node] = r
+    for node in G.nodes():
+        if node not in region_of:
+            region_of[node] = ('node', node)
+            region_nodes[('node', node)] = [node]
+
+    # Local layouts in edge length units
+    local_positions = {}
+    radius = {}
+    for r, nodes in region_nodes.items():
+        pos = sparse_stress_layout(G.subgraph(nodes), weight=weight, nb_pivots=nb_pivots, scale=None, seed=rng)
+        local_positions[r] = pos
+        radius[r] = max([np.linalg.norm(p) for p in pos.values()] + [0.0]) + 1.0
+
+    # Regions placement on the region graph
+    region_graph = nx.Graph()
+    region_graph.add_nodes_from(region_nodes.keys())
+    for (u, v) in G.edges():
+        ru, rv = region_of[u], region_of[v]
+        if ru != rv:
+            region_graph.add_edge(ru, rv, length=radius[ru] + radius[rv])
+    initial_centers = {}
+    for k, r in enumerate(region_graph.nodes()):
+        if r[0] == 'region' and r[1] in centers:
+            initial_centers[r] = np.asarray(centers[r[1]], dtype=float) * max(radius.values())
+        else:
+            initial_centers[r] = rng.normal(size=2) * max(radius.values())
+    if region_graph.number_of_nodes() > 1 and nx.is_connected(region_graph):
+        region_positions = sparse_stress_layout(region_graph, weight='length', pos=initial_centers, nb_pivots=nb_pivots, scale=None, seed=rng)
+    else:
+        region_positions = initial_centers
+
+    # Stitching and short global refinement
+    initial_positions = {}
+    for r, pos in local_positions.items():
+        for node, p in pos.items():
+            initial_positions[node] = region_positions[r] + p
+    return sparse_stress_layout(G, weight=weight, pos=initial_positions, nb_pivots=nb_pivots, max_iter=refine_iter, scale=scale, center=center, seed=rng)
+
+
+def layout_stress(G: nx.Graph, pos, weight='weight', nb_sources=None, seed=None):
+    """ Computes the normalized stress of a layout against the graph shortest path distances (lower is better).
+    Positions are optimally rescaled first, so layouts computed at different scales can be compared.
+
+    Args:
+        G (networkx.Graph): Graph laid out
+        pos (dict): 2D spatial coordinates of the nodes
+        weight (str): Edge attribute used as edge length (default = 'weight')
+        nb_sources (int, optional): Number of randomly sampled source nodes used to estimate the stress on large graphs. If None, all pairs are used (default = None)
+        seed (int or numpy.random.Generator, optional): Seed of the sources sampling (default = None)
+
+    Returns:
+        float: normalized stress
+    """
+    nodes, _, _, _, adjacency = _graph_to_csr(G, weight)
+    n = len(nodes)
+    X = np.array([pos[node] for node in nodes], dtype=float)
+    if nb_sources is None or nb_sources >= n:
+        sources = np.arange(n)
+    else:
+        sources = np.random.default_rng(seed).choice(n, size=nb_sources, replace=False)
+
+    cross = 0.0
+    count = 0.0
+    squared = 0.0
+    for chunk in np.array_split(sources, max(1, len(sources) // 256)):
+        d = dijkstra(adjacency, directed=False, indices=chunk)
+        euclidean_distances = np.linalg.norm(X[chunk][:, None, :] - X[None, :, :], axis=2)
+        mask = np.isfinite(d) & (d > 0)
+        d = d[mask]
+        e = euclidean_distances[mask]
+        # Terms weighted by 1/d², alpha is the optimal scaling of the layout
+        cross += np.sum(e / d)
+        squared += np.sum((e / d) ** 2)
+        count += len(d)
+    alpha = cross / squared if squared > 0 else 1.0
+    return float((alpha ** 2 * squared - 2 * alpha * cross + count) / max(count, 1.0))
+
+
+def compute_layout(G: nx.Graph, backend=KAMADA_KAWAI_LAYOUT, weight='weight', scale=10, center=None, seed=None, regions=None, region_centers=None):
+    """ Computes the 2D layout of a DHN graph with the selected backend
+
+    Args:
+        G (networkx.Graph): Graph to lay out
+        backend (str): 'kamada_kawai' (dense, O(n²) memory), 'sparse_stress' (see *sparse_stress_layout*) or 'hierarchical' (see *hierarchical_layout*) (default = 'kamada_kawai')
+        weight (str): Edge attribute used as edge length (default = 'weight')
+        scale (float): Scale factor of the positions (default = 10)
+        center (array-like, optional): Center of the layout (default = None)
+        seed (int or numpy.random.Generator, optional): Seed of the randomized backends (default = None)
+        regions (dict, optional): Node labels of each region, used by the hierarchical backend. Without regions, the hierarchical backend falls back to the sparse stress one (default = None)
+        region_centers (dict, optional): 2D spatial coordinates used as initial center of each region, used by the hierarchical backend (default = None)
+
+    Raises:
+        Exception: raise exception if the backend is unknown
+
+    Returns:
+        dict: 2D spatial coordinates of the nodes
+    """
+    if backend == KAMADA_KAWAI_LAYOUT:
+        return nx.kamada_kawai_layout(G, scale=scale, center=center, dim=2, weight=weight)
+    elif backend == SPARSE_STRESS_LAYOUT:
+        return sparse_stress_layout(G, weight=weight, scale=scale, center=center, seed=seed)
+    elif backend == HIERARCHICAL_LAYOUT:
+        if not regions:
+            return sparse_stress_layout(G, weight=weight, scale=scale, center=center, seed=seed)
+        return hierarchical_layout(G, regions, region_centers, weight=weight, scale=scale, center=center, seed=seed)
+    raise Exception(f'Unknown layout backend {backend}! Use one of [{KAMADA_KAWAI_LAYOUT}, {SPARSE_STRESS_LAYOUT}, {HIERARCHICAL_LAYOUT}]')
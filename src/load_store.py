@@ -0,0 +1,283 @@
+""" Memory-mapped store of the loads of a generated DHN.
+
+The loads (hours x substations) are written as a raw C-ordered array in *loads.bin* next to a small JSON header *loads.json* holding the dtype, the shape, the substations labels, the hour steps and the units. Opening a store only parses the header and maps the file, whatever its size, and basic slicing (ex: loads[t0:t1, n0:n1]) returns NumPy views of the mapped file, without any pandas parsing. Hour ranges are contiguous in the file, a range of substations is a strided view.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+LOAD_STORE_DATA_FILE = 'loads.bin'
+LOAD_STORE_HEADER_FILE = 'loads.json'
+LOAD_STORE_VERSION = 1
+LOAD_STORE_DTYPES = [np.dtype(np.float32), np.dtype(np.float64)]
+
+
+def _json_label(label):
+    """ Converts a substation label to a JSON serializable value (ex: numpy integers)
+
+    Args:
+        label: substation label
+
+    Returns:
+        int, float or str: label
+    """
+    return label.item() if isinstance(label, np.generic) else label
+
+
+def _as_slice(positions):
+    """ Converts consecutive positions into a slice, so that selecting them gives a view instead of a copy
+
+    Args:
+        positions (numpy.ndarray): positions
+
+    Returns:
+        slice or numpy.ndarray: the equivalent slice, or the positions if they are not consecutive
+    """
+    if len(positions) > 0 and np.all(np.diff(positions) == 1):
+        return slice(int(positions[0]), int(positions[-1]) + 1)
+    return positions
+
+
+def _loads_description(loads, hours=None, labels=None):
+    """ Gets the shape, labels, hour steps and window function of the loads to write
+
+    Args:
+        loads (numpy.ndarray, pandas.DataFrame, FactorizedLoads or HeatingLawLoads): loads (hours x substations). The 'hours' column of a table is used as hour steps.
+        hours (array-like, optional): hour steps. Defaults to None, i.e. the ones of the loads or 0, 1, ...
+        labels (List, optional): substations labels. Defaults to None, i.e. the ones of the loads or 0..N-1
+
+    Returns:
+        Tuple: shape (hours, N), labels, hour steps and a function giving the loads of the hours [start, stop[
+    """
+    if isinstance(loads, pd.DataFrame):
+        if 'hours' in loads.columns:
+            if hours is None:
+                hours = loads['hours'].to_numpy()
+            loads = loads.drop(columns='hours')
+        if labels is None:
+            labels = list(loads.columns)
+        values = loads.to_numpy(dtype=float)
+    elif hasattr(loads, 'window'): # lazy loads of the demand models
+        if hours is None:
+            hours = getattr(loads, 'hours', None)
+        if labels is None:
+            labels = loads.labels
+        values = None
+    else:
+        values = np.asarray(loads)
+        if values.ndim != 2:
+            raise ValueError(f'The loads must be a 2D array (hours x substations), got the shape {values.shape}')
+
+    shape = tuple(loads.shape) if values is None else values.shape
+    labels = list(range(shape[1])) if labels is None else list(labels)
+    hours = np.arange(shape[0]) if hours is None else np.asarray(hours)
+    if len(labels) != shape[1] or len(hours) != shape[0]:
+        raise ValueError(f'{len(hours)} hour steps and {len(labels)} labels given for loads of shape {shape}')
+    window = (lambda start, stop: loads.window(start, stop)) if values is None else (lambda start, stop: values[start:stop])
+    return shape, labels, hours, window
+
+
+def write_load_store(folder: str, loads, hours=None, labels=None, units: str = 'kW', dtype=np.float32, block_hours: int = 730):
+    """ Writes the loads of a DHN as a memory-mapped store (loads.bin and loads.json) in folder.
+    The loads are written block by block of hours, so that lazy loads are never materialized at once. The files are written under temporary names then renamed, the header last, so that a store being written is never opened.
+
+    Args:
+        folder (str): folder of the DHN, created if needed
+        loads (numpy.ndarray, pandas.DataFrame, FactorizedLoads or HeatingLawLoads): loads (hours x substations). The 'hours' column of a table is used as hour steps.
+        hours (array-like, optional): hour steps. Defaults to None, i.e. the ones of the loads or 0, 1, ...
+        labels (List, optional): substations labels. Defaults to None, i.e. the ones of the loads or 0..N-1
+        units (str, optional): units of the loads. Defaults to 'kW'.
+        dtype (numpy.dtype, optional): float32 or float64. Defaults to float32, i.e. half the size for about 7 significant digits.
+        block_hours (int, optional): number of hours written at once. Defaults to 730, i.e. monthly blocks.
+
+    Returns:
+        str: path of the header file
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in LOAD_STORE_DTYPES:
+        raise ValueError(f'Unknown load store dtype {dtype}, available: float32, float64')
+    shape, labels, hours, window = _loads_description(loads, hours, labels)
+
+    os.makedirs(folder, exist_ok=True)
+    data_path = os.path.join(folder, LOAD_STORE_DATA_FILE)
+    header_path = os.path.join(folder, LOAD_STORE_HEADER_FILE)
+    if os.path.isfile(header_path):
+        os.remove(header_path) # the store is invalid until the new header is written
+
+    tmp_data_path = f'{data_path}.{os.getpid()}.tmp'
+    if shape[0] * shape[1] > 0:
+        data = np.memmap(tmp_data_path, dtype=dtype, mode='w+', shape=shape)
+        block_hours = max(1, int(block_hours))
+        for start in range(0, shape[0], block_hours):
+            stop = min(start + block_hours, shape[0])
+            data[start:stop] = window(start, stop)
+        data.flush()
+        del data
+    else:
+        open(tmp_data_path, 'wb').close() # a memmap can not be empty
+    os.replace(tmp_data_path, data_path)
+
+    header = {
+        'version': LOAD_STORE_VERSION,
+        'dtype': dtype.str,
+        'shape': list(shape),
+        'order': 'C',
+        'units': units,
+        'labels': [_json_label(label) for label in labels],
+        'hours': hours.tolist(),
+    }
+    tmp_header_path = f'{header_path}.{os.getpid()}.tmp'
+    with open(tmp_header_path, 'w') as f:
+        json.dump(header, f)
+    os.replace(tmp_header_path, header_path)
+    return header_path
+
+
+def read_load_store_header(folder: str):
+    """ Reads the header of the load store of a DHN, without mapping its loads
+
+    Args:
+        folder (str): folder of the DHN
+
+    Raises:
+        FileNotFoundError: if no load store is found
+
+    Returns:
+        dict: 'dtype', 'shape', 'order', 'units', 'labels' and 'hours' of the store
+    """
+    header_path = os.path.join(folder, LOAD_STORE_HEADER_FILE)
+    if not os.path.isfile(header_path):
+        raise FileNotFoundError(f'No load store found in {folder}')
+    with open(header_path) as f:
+        header = json.load(f)
+    if header.get('version') != LOAD_STORE_VERSION:
+        raise ValueError(f'Unsupported load store version {header.get("version")}')
+    return header
+
+
+class LoadStore(object):
+    """ Loads of a DHN read from a memory-mapped store (see write_load_store).
+
+    Attributes:
+        values (numpy.memmap): the loads (hours x substations), read-only unless opened with mode 'r+'
+        labels (List): label of each substation
+        hours (numpy.ndarray): hour steps
+        units (str): units of the loads
+    """
+
+    def __init__(self, folder: str, mode: str = 'r'):
+        """ Opens the load store of a DHN
+
+        Args:
+            folder (str): folder of the DHN
+            mode (str, optional): 'r' for read-only views, 'r+' to modify the loads in place or 'c' for copy-on-write. Defaults to 'r'.
+        """
+        header = read_load_store_header(folder)
+        self.folder = folder
+        self.dtype = np.dtype(header['dtype'])
+        self.units = header['units']
+        self.labels = header['labels']
+        self.hours = np.asarray(header['hours'])
+        self._columns = {label: j for j, label in enumerate(self.labels)}
+        shape = tuple(header['shape'])
+        if shape[0] * shape[1] > 0:
+            self.values = np.memmap(os.path.join(folder, LOAD_STORE_DATA_FILE), dtype=self.dtype, mode=mode, shape=shape, order=header['order'])
+        else:
+            self.values = np.empty(shape, dtype=self.dtype)
+
+    @property
+    def shape(self):
+        """Tuple: shape (hours, N) of the loads"""
+        return self.values.shape
+
+    @property
+    def nbytes(self):
+        """int: size of the loads file"""
+        return self.values.nbytes
+
+    def columns(self, labels):
+        """ Gets the positions of some substations
+
+        Args:
+            labels (List): substations labels
+
+        Returns:
+            numpy.ndarray: positions of the substations in the store
+        """
+        return np.array([self._columns[label] for label in labels], dtype=np.int64)
+
+    def window(self, start=0, stop=None, labels=None):
+        """ Gets the loads of a time window and of some substations. The result is a view of the file if the substations are consecutive in the store, a copy otherwise
+
+        Args:
+            start (int, optional): first hour. Defaults to 0.
+            stop (int, optional): hour after the last one. Defaults to None, i.e. the end of the period.
+            labels (List, optional): substations labels. Defaults to None, i.e. all.
+
+        Returns:
+            numpy.ndarray: loads (hours x substations)
+        """
+        if labels is None:
+            return self.values[start:stop]
+        return self.values[start:stop, _as_slice(self.columns(labels))]
+
+    def node(self, label):
+        """ Gets the loads of one substation over the period (strided view of the file)
+
+        Args:
+            label: label of the substation
+
+        Returns:
+            numpy.ndarray: loads (hours)
+        """
+        return self.values[:, self._columns[label]]
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.values, dtype=dtype)
+
+    def to_dataframe(self, start=0, stop=None, labels=None):
+        """ Copies the loads of a time window as a table, with the hour steps followed by one column per substation label
+
+        Args:
+            start (int, optional): first hour. Defaults to 0.
+            stop (int, optional): hour after the last one. Defaults to None, i.e. the end of the period.
+            labels (List, optional): substations labels. Defaults to None, i.e. all.
+
+        Returns:
+            pandas.DataFrame: loads
+        """
+        start, stop, _ = slice(start, stop).indices(self.shape[0])
+        df_loads = pd.DataFrame(np.array(self.window(start, stop, labels)), columns=self.labels if labels is None else list(labels), index=range(start, stop))
+        df_loads.insert(loc=0, column='hours', value=self.hours[start:stop])
+        return df_loads
+
+    def close(self):
+        """ Releases the mapped file (the views taken from the store keep it mapped) """
+        if isinstance(self.values, np.memmap):
+            self.values.flush()
+        self.values = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def open_load_store(folder: str, mode: str = 'r'):
+    """ Opens the load store of a DHN, only its header being read
+
+    Args:
+        folder (str): folder of the DHN
+        mode (str, optional): 'r' for read-only views, 'r+' to modify the loads in place or 'c' for copy-on-write. Defaults to 'r'.
+
+    Returns:
+        LoadStore: the loads
+    """
+    return LoadStore(folder, mode)
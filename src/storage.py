@@ -0,0 +1,406 @@
+""" Storage backends of the tables of a generated DHN (nodes, pipes, consumers and loads).
+
+Excel (one workbook, one sheet per table) is limited to 16,384 columns, hence to about 16k substations in the loads table, and is slow to write. The columnar backends have no such limit:
+- 'parquet' and 'feather' write one file per table and require pyarrow
+- 'hdf5' writes all the tables in one file and requires h5py
+"""
+import importlib.util
+import os
+
+import numpy as np
+import pandas as pd
+
+EXCEL_STORAGE = 'excel'
+PARQUET_STORAGE = 'parquet'
+FEATHER_STORAGE = 'feather'
+HDF5_STORAGE = 'hdf5'
+
+EXCEL_MAX_COLUMNS = 16384
+INDEX_COLUMN = '__index__' # Column holding the index of the tables written with their index in the columnar backends
+
+
+def _restore_column_names(columns):
+    """ Converts back to integers the column names that were integers before being written as strings (ex: node labels of the loads table)
+
+    Args:
+        columns (Iterable[str]): Column names read from the file
+
+    Returns:
+        List: column names
+    """
+    return [int(c) if isinstance(c, str) and c.lstrip('-').isdigit() else c for c in columns]
+
+
+def _to_columnar(df: pd.DataFrame, index=False):
+    """ Prepares a table for a columnar file: string column names and the index stored as a column if required
+
+    Args:
+        df (pandas.DataFrame): Table
+        index (bool): Whether to keep the index (default = False)
+
+    Returns:
+        pandas.DataFrame: table to write
+    """
+    df = df.copy(deep=False)
+    df.columns = [str(c) for c in df.columns]
+    if index:
+        df.insert(0, INDEX_COLUMN, df.index.to_numpy())
+    return df.reset_index(drop=True)
+
+
+def _from_columnar(df: pd.DataFrame):
+    """ Restores a table read from a columnar file
+
+    Args:
+        df (pandas.DataFrame): Table read
+
+    Returns:
+        pandas.DataFrame: table
+    """
+    if INDEX_COLUMN in df.columns:
+        df = df.set_index(INDEX_COLUMN)
+        df.index.name = None
+    df.columns = _restore_column_names(df.columns)
+    return df
+
+
+class TopologyStorage(object):
+    """ Base class of the storage backends. A backend is opened, the tables are written one by one, then it is closed, like a pandas ExcelWriter.
+
+    Attributes:
+        folder (str): Folder of the generated DHN
+    """
+    storage_format = None
+
+    def __init__(self, folder: str):
+        """ Initializes the TopologyStorage
+
+        Args:
+            folder (str): Folder of the generated DHN
+        """
+        self.folder = folder
+
+    def exists(self):
+        """ Checks if tables have been written in the folder with this backend
+
+        Returns:
+            bool: True if the storage file(s) exist
+        """
+        raise NotImplementedError
+
+    def open(self, mode='w'):
+        """ Opens the storage for writing
+
+        Args:
+            mode (str): 'w' to start from an empty storage, 'a' to add or replace tables of an existing one (default = 'w')
+        """
+        os.makedirs(self.folder, exist_ok=True)
+
+    def write_table(self, name: str, df: pd.DataFrame, index=False):
+        """ Writes one table, an existing table with the same name is replaced
+
+        Args:
+            name (str): Name of the table (ex: 'nodes')
+            df (pandas.DataFrame): Table
+            index (bool): Whether to write the index of the table (default = False)
+        """
+        raise NotImplementedError
+
+    def write_table_blocks(self, name: str, blocks, index=False):
+        """ Writes one table from consecutive blocks of rows (ex: time windows of the loads), an existing table with the same name is replaced.
+        The columnar backends write each block as soon as it is given, so that only one block is in memory. Excel cannot be written by blocks, the blocks are concatenated first.
+
+        Args:
+            name (str): Name of the table (ex: 'loads')
+            blocks (Iterable[pandas.DataFrame]): Consecutive blocks of rows, with the same columns
+            index (bool): Whether to write the index of the table (default = False)
+        """
+        self.write_table(name, pd.concat(list(blocks)), index=index)
+
+    def delete_table(self, name: str):
+        """ Deletes one table if it exists
+
+        Args:
+            name (str): Name of the table
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """ Closes the storage
+        """
+        pass
+
+    def read_tables(self, names=None):
+        """ Reads tables
+
+        Args:
+            names (List[str], optional): Names of the tables to read. If None, every table (default = None)
+
+        Returns:
+            dict: tables (pandas.DataFrame) indexed by their names
+        """
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ExcelStorage(TopologyStorage):
+    """ Tables stored as the sheets of *topology.xlsx*
+    """
+    storage_format = EXCEL_STORAGE
+    file_name = 'topology.xlsx'
+
+    def __init__(self, folder: str):
+        super().__init__(folder)
+        self.path = os.path.join(folder, self.file_name)
+        self._writer = None
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def open(self, mode='w'):
+        super().open(mode)
+        if mode == 'a' and self.exists():
+            # Appending re-parses the whole workbook, prefer rewriting it with mode 'w'
+            self._writer = pd.ExcelWriter(self.path, engine='openpyxl', mode='a', if_sheet_exists='replace')
+        else:
+            engine = 'xlsxwriter' if importlib.util.find_spec('xlsxwriter') is not None else 'openpyxl'
+            self._writer = pd.ExcelWriter(self.path, engine=engine, mode='w')
+
+    def write_table(self, name: str, df: pd.DataFrame, index=False):
+        if df.shape[1] + int(index) > EXCEL_MAX_COLUMNS:
+            raise ValueError(f'Table {name} has {df.shape[1]} columns, more than the {EXCEL_MAX_COLUMNS} columns of an Excel sheet. Use a columnar storage format (parquet, feather or hdf5)')
+        if index:
+            df.to_excel(self._writer, sheet_name=name, index=True, index_label=True)
+        else:
+            df.to_excel(self._writer, sheet_name=name, index=False, index_label=False)
+
+    def delete_table(self, name: str):
+        book = self._writer.book
+        if self._writer.engine == 'openpyxl' and name in book.sheetnames:
+            book.remove(book[name])
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def read_tables(self, names=None):
+        return pd.read_excel(self.path, sheet_name=names)
+
+
+class ArrowStorage(TopologyStorage):
+    """ Tables stored as one Parquet or Feather file per table (requires pyarrow)
+    """
+    storage_format = PARQUET_STORAGE
+
+    def __init__(self, folder: str, storage_format: str = PARQUET_STORAGE):
+        super().__init__(folder)
+        if storage_format not in [PARQUET_STORAGE, FEATHER_STORAGE]:
+            raise ValueError(f'Unknown arrow storage format {storage_format}')
+        self.storage_format = storage_format
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError(f'The {storage_format} storage requires pyarrow (pip install pyarrow)')
+
+    def _path(self, name: str):
+        return os.path.join(self.folder, f'{name}.{self.storage_format}')
+
+    def _table_names(self):
+        if not os.path.isdir(self.folder):
+            return []
+        extension = f'.{self.storage_format}'
+        return sorted(f[:-len(extension)] for f in os.listdir(self.folder) if f.endswith(extension))
+
+    def exists(self):
+        return 'nodes' in self._table_names()
+
+    def open(self, mode='w'):
+        super().open(mode)
+        if mode == 'w':
+            for name in self._table_names():
+                os.remove(self._path(name))
+
+    def write_table(self, name: str, df: pd.DataFrame, index=False):
+        df = _to_columnar(df, index)
+        if self.storage_format == PARQUET_STORAGE:
+            df.to_parquet(self._path(name), index=False)
+        else:
+            df.to_feather(self._path(name))
+
+    def write_table_blocks(self, name: str, blocks, index=False):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for df in blocks:
+                table = pa.Table.from_pandas(_to_columnar(df, index), preserve_index=False)
+                if writer is None:
+                    if self.storage_format == PARQUET_STORAGE:
+                        writer = pq.ParquetWriter(self._path(name), table.schema)
+                    else:
+                        writer = pa.ipc.new_file(self._path(name), table.schema) # Feather v2 is the Arrow IPC file format
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def delete_table(self, name: str):
+        if os.path.isfile(self._path(name)):
+            os.remove(self._path(name))
+
+    def read_tables(self, names=None):
+        if names is None:
+            names = self._table_names()
+        tables = {}
+        for name in names:
+            if self.storage_format == PARQUET_STORAGE:
+                df = pd.read_parquet(self._path(name))
+            else:
+                df = pd.read_feather(self._path(name))
+            tables[name] = _from_columnar(df)
+        return tables
+
+
+class HDF5Storage(TopologyStorage):
+    """ Tables stored in *topology.h5*, one group per table (requires h5py).
+    The columns of a table are stored as one chunked 2D dataset (rows x columns) per dtype, extended block by block, so that the loads table is written and read in a few operations whatever its number of substations.
+    """
+    storage_format = HDF5_STORAGE
+    file_name = 'topology.h5'
+
+    def __init__(self, folder: str):
+        super().__init__(folder)
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError('The hdf5 storage requires h5py (pip install h5py)')
+        self._h5py = h5py
+        self.path = os.path.join(folder, self.file_name)
+        self._file = None
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def open(self, mode='w'):
+        super().open(mode)
+        self._file = self._h5py.File(self.path, 'a' if mode == 'a' else 'w')
+
+    def write_table(self, name: str, df: pd.DataFrame, index=False):
+        self.write_table_blocks(name, [df], index=index)
+
+    def write_table_blocks(self, name: str, blocks, index=False):
+        if name in self._file:
+            del self._file[name]
+        group = None
+        nb_rows = 0
+        for df in blocks:
+            df = _to_columnar(df, index)
+            if group is None:
+                # Datasets created from the first block and extended along the rows. Column names and positions are datasets since attributes are limited to 64 kB
+                group = self._file.create_group(name)
+                group.create_dataset('columns', data=np.array(df.columns, dtype=object), dtype=self._h5py.string_dtype())
+                dtypes = [dtype if pd.api.types.is_numeric_dtype(dtype) else np.dtype(object) for dtype in df.dtypes]
+                layout = []
+                for b, dtype in enumerate(sorted(set(dtypes), key=str)):
+                    positions = np.array([i for i, d in enumerate(dtypes) if d == dtype], dtype=np.int64)
+                    chunks = (max(1, min(len(df), 64)), min(len(positions), 2048)) # about 1 MB
+                    if dtype == np.dtype(object):
+                        dataset = group.create_dataset(f'block{b}', shape=(0, len(positions)), maxshape=(None, len(positions)), dtype=self._h5py.string_dtype(), chunks=chunks)
+                    else:
+                        dataset = group.create_dataset(f'block{b}', shape=(0, len(positions)), maxshape=(None, len(positions)), dtype=dtype, chunks=chunks, compression='lzf') # fast compression, the loads are written in many blocks
+                    group.create_dataset(f'positions{b}', data=positions)
+                    layout.append((dataset, positions, dtype))
+            for dataset, positions, dtype in layout:
+                values = df.iloc[:, positions].to_numpy()
+                values = values.astype(str).astype(object) if dtype == np.dtype(object) else values.astype(dtype)
+                dataset.resize(nb_rows + len(df), axis=0)
+                dataset[nb_rows:nb_rows + len(df)] = values
+            nb_rows += len(df)
+
+    def delete_table(self, name: str):
+        if name in self._file:
+            del self._file[name]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def read_tables(self, names=None):
+        tables = {}
+        with self._h5py.File(self.path, 'r') as f:
+            if names is None:
+                names = list(f.keys())
+            for name in names:
+                group = f[name]
+                columns = list(group['columns'].asstr()[()])
+                data = [None] * len(columns)
+                b = 0
+                while f'block{b}' in group:
+                    dataset = group[f'block{b}']
+                    values = dataset.asstr()[()] if dataset.dtype.kind == 'O' else dataset[()]
+                    for j, i in enumerate(group[f'positions{b}'][()]):
+                        data[i] = values[:, j]
+                    b += 1
+                df = pd.DataFrame(dict(zip(range(len(columns)), data)))
+                df.columns = columns
+                tables[name] = _from_columnar(df)
+        return tables
+
+
+STORAGE_FORMATS = [EXCEL_STORAGE, PARQUET_STORAGE, FEATHER_STORAGE, HDF5_STORAGE]
+
+
+def get_storage(folder: str, storage_format: str = EXCEL_STORAGE):
+    """ Gets the storage backend of a generated DHN folder
+
+    Args:
+        folder (str): Folder of the generated DHN
+        storage_format (str): One of 'excel', 'parquet', 'feather' or 'hdf5' (default = 'excel')
+
+    Returns:
+        TopologyStorage: the storage backend
+    """
+    if storage_format == EXCEL_STORAGE:
+        return ExcelStorage(folder)
+    elif storage_format in [PARQUET_STORAGE, FEATHER_STORAGE]:
+        return ArrowStorage(folder, storage_format)
+    elif storage_format == HDF5_STORAGE:
+        return HDF5Storage(folder)
+    raise ValueError(f'Unknown storage format {storage_format}, expected one of {STORAGE_FORMATS}')
+
+
+def detect_storage(path: str):
+    """ Finds the storage backend of a generated DHN from its folder or one of its files (ex: topology.xlsx). When several formats are present in a folder, the columnar ones are preferred.
+
+    Args:
+        path (str): Folder of the generated DHN or path of one of its storage files
+
+    Raises:
+        FileNotFoundError: if no storage is found
+
+    Returns:
+        TopologyStorage: the storage backend
+    """
+    if os.path.isfile(path):
+        folder, file = os.path.split(path)
+        extension = os.path.splitext(file)[1].lower()
+        formats = {'.xlsx': EXCEL_STORAGE, '.h5': HDF5_STORAGE, '.hdf5': HDF5_STORAGE, '.parquet': PARQUET_STORAGE, '.feather': FEATHER_STORAGE}
+        if extension not in formats:
+            raise ValueError(f'Unknown storage file {path}')
+        return get_storage(folder, formats[extension])
+
+    for storage_format in [HDF5_STORAGE, PARQUET_STORAGE, FEATHER_STORAGE, EXCEL_STORAGE]:
+        try:
+            storage = get_storage(path, storage_format)
+        except ImportError:
+            continue
+        if storage.exists():
+            return storage
+    raise FileNotFoundError(f'No generated DHN found in {path}')